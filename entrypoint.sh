@@ -24,4 +24,8 @@ nginx -g 'daemon off;' &
 
 python $APP_WORKDIR/main.py &
 
-python -m gunicorn service.app:app -b 127.0.0.1:$APP_PORT --timeout=1000
+if [ "$(python -c 'from utils.config import config; print(config.open_async_service)')" = "True" ]; then
+  python -m gunicorn service.async_app:app -b 127.0.0.1:$APP_PORT --worker-class aiohttp.GunicornWebWorker --timeout=1000
+else
+  python -m gunicorn service.app:app -b 127.0.0.1:$APP_PORT --timeout=1000
+fi
@@ -1,17 +1,16 @@
 import asyncio
 import copy
 import datetime
-import gzip
 import os
-import pickle
 from time import time
-from typing import Callable, Optional, Any
+from typing import Callable, Optional, Any, Mapping
 
 import pytz
 from tqdm import tqdm
 
 import utils.constants as constants
 import utils.frozen as frozen
+import utils.probe_store as probe_store
 from updates.epg import get_epg
 from updates.epg.tools import write_to_xml, compress_to_gz
 from updates.fofa import get_channels_by_fofa
@@ -20,8 +19,10 @@ from updates.multicast import get_channels_by_multicast
 from updates.online_search import get_channels_by_online_search
 from updates.subscribe import get_channels_by_subscribe_urls
 from utils.aggregator import ResultAggregator
+from utils.cache_store import get_cache, save_cache
 from utils.channel import get_channel_items, append_total_data, test_speed
 from utils.config import config
+from utils.db import get_db_stats
 from utils.i18n import t
 from utils.speed import clear_cache
 from utils.tools import (
@@ -34,7 +35,6 @@ from utils.tools import (
     get_urls_len,
     get_public_url,
     parse_times,
-    to_serializable,
 )
 from utils.types import CategoryChannelData
 from utils.whitelist import load_whitelist_maps, get_section_entries
@@ -98,22 +98,16 @@ class UpdateSource:
     # ----------------------------
     # IO: cache
     # ----------------------------
-    def _load_cache(self) -> dict:
-        if not (config.open_history and os.path.exists(constants.cache_path)):
+    def _load_cache(self) -> Mapping:
+        if not config.open_history:
             return {}
         try:
-            with gzip.open(constants.cache_path, "rb") as f:
-                return pickle.load(f) or {}
+            return get_cache(constants.cache_path, constants.legacy_cache_path).as_result()
         except Exception:
             return {}
 
     def _save_cache(self, cache_result: dict):
-        serializable = to_serializable(cache_result or {})
-        cache_dir = os.path.dirname(constants.cache_path)
-        if cache_dir:
-            os.makedirs(cache_dir, exist_ok=True)
-        with gzip.open(constants.cache_path, "wb") as f:
-            pickle.dump(serializable, f)
+        save_cache(constants.cache_path, cache_result, constants.legacy_cache_path)
 
     # ----------------------------
     # stage 1: prepare
@@ -128,8 +122,9 @@ class UpdateSource:
             name for channel_obj in self.channel_items.values() for name in channel_obj.keys()
         ]
 
-        if config.open_history and os.path.exists(constants.frozen_path):
-            frozen.load(constants.frozen_path)
+        if config.open_history and (
+                os.path.exists(constants.frozen_path) or os.path.exists(constants.legacy_frozen_path)):
+            frozen.load(constants.frozen_path, constants.legacy_frozen_path)
 
     # ----------------------------
     # stage 2: fetch subscribe/epg (concurrent)
@@ -337,16 +332,22 @@ class UpdateSource:
             try:
                 if config.open_speed_test:
                     clear_cache()
+                    await probe_store.load_async(constants.probe_data_path)
                     await self._run_speed_test()
                 else:
                     self.aggregator.is_last = True
                     await self.aggregator.flush_once(force=True)
 
             finally:
+                if config.open_speed_test:
+                    await probe_store.save_async(constants.probe_data_path)
                 if config.open_history:
                     self._save_cache(self.aggregator.result)
-                    frozen.save(constants.frozen_path)
+                    frozen.save(constants.frozen_path, constants.legacy_frozen_path)
                 await self._stop_aggregator()
+                for db_path, stats in get_db_stats().items():
+                    if stats["write"] or stats["read"]:
+                        print(t("msg.db_pool_stats").format(name=os.path.basename(db_path), **stats))
 
             print(
                 t("msg.update_completed").format(
@@ -1,16 +1,17 @@
 import os
 import sys
-import time
 
 sys.path.append(os.path.dirname(sys.path[0]))
-from flask import Flask, send_from_directory, make_response, request, jsonify, Response
+from flask import Flask, send_from_directory, make_response, request, jsonify, Response, send_file
 from flask_cors import CORS
 from utils.tools import get_result_file_content, resource_path, get_public_url
 from utils.config import config
+from service.log_stream import get_log_params, resolve_start, iter_log
 import utils.constants as constants
 import atexit
 from service.rtmp import start_rtmp_service, stop_rtmp_service, app_rtmp_url, hls_temp_path, STREAMS_LOCK, \
-    hls_running_streams, start_hls_to_rtmp, hls_last_access, HLS_WAIT_TIMEOUT, HLS_WAIT_INTERVAL
+    hls_running_streams, start_hls_to_rtmp, record_channel_access, ensure_hls_prewarm_started, HLS_WAIT_TIMEOUT, \
+    hls_ready_notifier, is_stream_running, mark_stream_requested
 import logging
 from utils.i18n import t
 from werkzeug.utils import secure_filename
@@ -20,6 +21,7 @@ app = Flask(__name__)
 CORS(app)
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
+ensure_hls_prewarm_started()
 
 
 @app.route("/images/<path:filename>")
@@ -189,52 +191,43 @@ def show_epg_gz():
     return get_result_file_content(path=constants.epg_gz_result_path, file_type="gz", show_content=False)
 
 
+def get_log_content(path):
+    """
+    Get the log response, the whole file supports the range and conditional requests,
+    tail=N returns the last lines and offset=N the content after the offset, follow=1 is only streamed by the
+    async service, here the content up to X-Log-Offset is returned for the client to poll from
+    """
+    if not os.path.exists(path):
+        response = make_response(constants.waiting_tip)
+        response.mimetype = "text/plain"
+        return response
+    size = os.path.getsize(path)
+    start, _ = get_log_params(request.args, size)
+    if start is None:
+        return send_file(path, mimetype="text/plain", conditional=True, max_age=0)
+    start = resolve_start(path, start)
+    headers = {"Cache-Control": "no-cache", "X-Log-Start": str(start), "X-Log-Offset": str(size)}
+    return Response(iter_log(path, start, size), mimetype="text/plain", headers=headers)
+
+
 @app.route("/log/result")
 def show_result_log():
-    if os.path.exists(constants.result_log_path):
-        with open(constants.result_log_path, "r", encoding="utf-8") as file:
-            content = file.read()
-    else:
-        content = constants.waiting_tip
-    response = make_response(content)
-    response.mimetype = "text/plain"
-    return response
+    return get_log_content(constants.result_log_path)
 
 
 @app.route("/log/speed-test")
 def show_speed_log():
-    if os.path.exists(constants.speed_test_log_path):
-        with open(constants.speed_test_log_path, "r", encoding="utf-8") as file:
-            content = file.read()
-    else:
-        content = constants.waiting_tip
-    response = make_response(content)
-    response.mimetype = "text/plain"
-    return response
+    return get_log_content(constants.speed_test_log_path)
 
 
 @app.route("/log/statistic")
 def show_statistic_log():
-    if os.path.exists(constants.statistic_log_path):
-        with open(constants.statistic_log_path, "r", encoding="utf-8") as file:
-            content = file.read()
-    else:
-        content = constants.waiting_tip
-    response = make_response(content)
-    response.mimetype = "text/plain"
-    return response
+    return get_log_content(constants.statistic_log_path)
 
 
 @app.route("/log/nomatch")
 def show_nomatch_log():
-    if os.path.exists(constants.nomatch_log_path):
-        with open(constants.nomatch_log_path, "r", encoding="utf-8") as file:
-            content = file.read()
-    else:
-        content = constants.waiting_tip
-    response = make_response(content)
-    response.mimetype = "text/plain"
-    return response
+    return get_log_content(constants.nomatch_log_path)
 
 
 @app.route('/hls_proxy/<channel_id>', methods=['GET'])
@@ -246,6 +239,7 @@ def hls_proxy(channel_id):
     m3u8_path = os.path.join(hls_temp_path, channel_file)
 
     need_start = False
+    mark_stream_requested(channel_id)
     with STREAMS_LOCK:
         proc = hls_running_streams.get(channel_id)
         if not proc or proc.poll() is not None:
@@ -257,21 +251,8 @@ def hls_proxy(channel_id):
         host = f"{app_rtmp_url}/hls"
         start_hls_to_rtmp(host, channel_id)
 
-    hls_min_segments = 3
-    waited = 0.0
-    while waited < HLS_WAIT_TIMEOUT:
-        if os.path.exists(m3u8_path):
-            try:
-                with open(m3u8_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                segment_count = content.count('#EXTINF')
-                ends_with_discont = content.rstrip().endswith('#EXT-X-DISCONTINUITY')
-                if segment_count >= hls_min_segments and not ends_with_discont:
-                    break
-            except Exception as e:
-                print(t("msg.error_channel_id_m3u8_read_info").format(channel_id=channel_id, info=e))
-        time.sleep(HLS_WAIT_INTERVAL)
-        waited += HLS_WAIT_INTERVAL
+    if is_stream_running(channel_id):
+        hls_ready_notifier.wait_ready(channel_id, HLS_WAIT_TIMEOUT)
 
     if not os.path.exists(m3u8_path):
         return jsonify({t("name.error"): t("msg.m3u8_hls_not_ready")}), 503
@@ -283,9 +264,7 @@ def hls_proxy(channel_id):
         print(t("msg.error_channel_id_m3u8_read_info").format(channel_id=channel_id, info=e))
         return jsonify({t("name.error"): t("msg.error_m3u8_read")}), 500
 
-    now = time.time()
-    with STREAMS_LOCK:
-        hls_last_access[channel_id] = now
+    record_channel_access(channel_id, warm=not need_start)
 
     return Response(data, mimetype='application/vnd.apple.mpegurl')
 
@@ -310,7 +289,12 @@ def run_service():
             print(t("msg.ipv4_api").format(api=f"{base_api}/ipv4"))
             print(t("msg.ipv6_api").format(api=f"{base_api}/ipv6"))
             print(t("msg.full_api").format(api=base_api))
-            app.run(host="127.0.0.1", port=config.app_port)
+            if config.open_async_service:
+                from aiohttp import web
+                from service.async_app import app as async_app
+                web.run_app(async_app, host="127.0.0.1", port=config.app_port, print=None)
+            else:
+                app.run(host="127.0.0.1", port=config.app_port)
     except Exception as e:
         print(t("msg.error_service_start_failed").format(info=e))
 
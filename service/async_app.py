@@ -0,0 +1,216 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(sys.path[0]))
+from aiohttp import web
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+import utils.constants as constants
+from service.log_stream import LOG_CHUNK_SIZE, get_log_params, resolve_start, follow_log_async
+from service.rtmp import app_rtmp_url, STREAMS_LOCK, hls_running_streams, start_hls_to_rtmp, record_channel_access, \
+    ensure_hls_prewarm_started, HLS_WAIT_TIMEOUT, hls_ready_notifier, is_stream_running, \
+    mark_stream_requested
+from utils.config import config
+from utils.i18n import t
+from utils.tools import get_result_file_path, resource_path
+
+TEXT_CONTENT_TYPE = "text/plain; charset=utf-8"
+
+
+def get_default_file_type():
+    return "m3u" if config.open_m3u_result else "txt"
+
+
+RESULT_ROUTES = {
+    "/": lambda: (constants.hls_result_path if config.open_rtmp else config.final_file, get_default_file_type()),
+    "/txt": lambda: (config.final_file, "txt"),
+    "/ipv4/txt": lambda: (constants.ipv4_result_path, "txt"),
+    "/ipv6/txt": lambda: (constants.ipv6_result_path, "txt"),
+    "/hls": lambda: (constants.hls_result_path, get_default_file_type()),
+    "/hls/txt": lambda: (constants.hls_result_path, "txt"),
+    "/hls/ipv4/txt": lambda: (constants.hls_ipv4_result_path, "txt"),
+    "/hls/ipv6/txt": lambda: (constants.hls_ipv6_result_path, "txt"),
+    "/m3u": lambda: (config.final_file, "m3u"),
+    "/hls/m3u": lambda: (constants.hls_result_path, "m3u"),
+    "/ipv4/m3u": lambda: (constants.ipv4_result_path, "m3u"),
+    "/ipv4": lambda: (
+        constants.hls_ipv4_result_path if config.open_rtmp else constants.ipv4_result_path, get_default_file_type()),
+    "/hls/ipv4": lambda: (constants.hls_ipv4_result_path, get_default_file_type()),
+    "/ipv6/m3u": lambda: (constants.ipv6_result_path, "m3u"),
+    "/ipv6": lambda: (
+        constants.hls_ipv6_result_path if config.open_rtmp else constants.ipv6_result_path, get_default_file_type()),
+    "/hls/ipv6": lambda: (constants.hls_ipv6_result_path, get_default_file_type()),
+    "/hls/ipv4/m3u": lambda: (constants.hls_ipv4_result_path, "m3u"),
+    "/hls/ipv6/m3u": lambda: (constants.hls_ipv6_result_path, "m3u"),
+    "/epg/epg.xml": lambda: (constants.epg_result_path, "xml"),
+    "/epg/epg.gz": lambda: (constants.epg_gz_result_path, "gz"),
+}
+
+LOG_ROUTES = {
+    "/log/result": lambda: constants.result_log_path,
+    "/log/speed-test": lambda: constants.speed_test_log_path,
+    "/log/statistic": lambda: constants.statistic_log_path,
+    "/log/nomatch": lambda: constants.nomatch_log_path,
+}
+
+
+def text_response(text, status=200):
+    return web.Response(text=text, status=status, content_type="text/plain")
+
+
+def send_file(path, content_type=None, as_attachment=False):
+    """
+    Send the file with sendfile, the validators and range requests are handled by the file response
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    headers = {"Cache-Control": "no-cache"}
+    if content_type:
+        headers["Content-Type"] = content_type
+    if as_attachment:
+        headers["Content-Disposition"] = f'attachment; filename="{os.path.basename(path)}"'
+    return web.FileResponse(path, headers=headers)
+
+
+def make_result_handler(get_args, show_content=False):
+    async def handler(request):
+        path, file_type = get_args()
+        result_file, as_attachment = get_result_file_path(path, show_content, file_type)
+        response = send_file(result_file, None if as_attachment else TEXT_CONTENT_TYPE, as_attachment)
+        return response or text_response(constants.waiting_tip)
+
+    return handler
+
+
+def make_log_handler(get_path):
+    async def handler(request):
+        path = get_path()
+        if not os.path.isfile(path):
+            return text_response(constants.waiting_tip)
+        size = os.path.getsize(path)
+        start, follow = get_log_params(request.query, size)
+        if start is None:
+            return send_file(path, TEXT_CONTENT_TYPE)
+        loop = asyncio.get_running_loop()
+        start = await loop.run_in_executor(None, resolve_start, path, start)
+        headers = {"Content-Type": TEXT_CONTENT_TYPE, "Cache-Control": "no-cache", "X-Log-Start": str(start)}
+        if not follow:
+            headers["X-Log-Offset"] = str(size)
+        response = web.StreamResponse(headers=headers)
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        if follow:
+            async for chunk in follow_log_async(path, start):
+                await response.write(chunk)
+        else:
+            with open(path, "rb") as f:
+                f.seek(start)
+                while start < size:
+                    chunk = await loop.run_in_executor(None, f.read, min(LOG_CHUNK_SIZE, size - start))
+                    if not chunk:
+                        break
+                    start += len(chunk)
+                    await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    return handler
+
+
+async def show_images(request):
+    path = safe_join(resource_path("static/images"), request.match_info["filename"])
+    return send_file(path) or web.json_response({"error": "image not found"}, status=404)
+
+
+async def favicon(request):
+    return send_file(resource_path("favicon.ico"), "image/vnd.microsoft.icon") or web.Response(status=404)
+
+
+async def show_source_json(request):
+    return send_file(resource_path("source.json"), "application/json") or web.Response(status=404)
+
+
+async def show_logo(request):
+    filename = request.match_info.get("filename")
+    try:
+        safe_name = secure_filename(filename, allow_unicode=True)
+    except TypeError:
+        safe_name = os.path.basename(filename).replace('/', '').replace('\\', '').lstrip('.')
+    if not safe_name:
+        return web.json_response({"error": "filename required"}, status=400)
+    response = send_file(os.path.join(resource_path(constants.channel_logo_path), safe_name))
+    return response or web.json_response({"error": "logo not found"}, status=404)
+
+
+async def hls_proxy(request):
+    channel_id = request.match_info.get("channel_id")
+    if not channel_id:
+        return web.json_response({t("name.error"): t("msg.error_channel_id_required")}, status=400)
+
+    m3u8_path = hls_ready_notifier.get_path(channel_id)
+    mark_stream_requested(channel_id)
+    with STREAMS_LOCK:
+        proc = hls_running_streams.get(channel_id)
+        need_start = not proc or proc.poll() is not None
+        if need_start:
+            hls_running_streams.pop(channel_id, None)
+
+    loop = asyncio.get_running_loop()
+    if need_start:
+        await loop.run_in_executor(None, start_hls_to_rtmp, f"{app_rtmp_url}/hls", channel_id)
+
+    if is_stream_running(channel_id):
+        await hls_ready_notifier.wait_ready_async(channel_id, HLS_WAIT_TIMEOUT)
+
+    if not os.path.exists(m3u8_path):
+        return web.json_response({t("name.error"): t("msg.m3u8_hls_not_ready")}, status=503)
+
+    try:
+        with open(m3u8_path, 'rb') as f:
+            data = f.read()
+    except Exception as e:
+        print(t("msg.error_channel_id_m3u8_read_info").format(channel_id=channel_id, info=e))
+        return web.json_response({t("name.error"): t("msg.error_m3u8_read")}, status=500)
+
+    record_channel_access(channel_id, warm=not need_start)
+
+    return web.Response(body=data, content_type="application/vnd.apple.mpegurl")
+
+
+async def on_done(request):
+    form = await request.post()
+    print(t("msg.rtmp_on_done").format(channel_id=form.get("name", "")))
+    return web.Response(text="")
+
+
+async def add_cors_headers(request, response):
+    response.headers.setdefault("Access-Control-Allow-Origin", "*")
+
+
+def create_app():
+    """
+    Create the asyncio service with the same routes as the flask service
+    """
+    ensure_hls_prewarm_started()
+    app = web.Application()
+    app.on_response_prepare.append(add_cors_headers)
+    for route, get_args in RESULT_ROUTES.items():
+        app.router.add_get(route, make_result_handler(get_args))
+    app.router.add_get("/content", make_result_handler(
+        lambda: (constants.hls_result_path if config.open_rtmp else config.final_file, get_default_file_type()),
+        show_content=True
+    ))
+    for route, get_path in LOG_ROUTES.items():
+        app.router.add_get(route, make_log_handler(get_path))
+    app.router.add_get("/images/{filename:.+}", show_images)
+    app.router.add_get("/favicon.ico", favicon)
+    app.router.add_get("/source.json", show_source_json)
+    app.router.add_get("/logo/{filename:.+}", show_logo)
+    app.router.add_get("/hls_proxy/{channel_id}", hls_proxy)
+    app.router.add_post("/on_done", on_done)
+    return app
+
+
+app = create_app()
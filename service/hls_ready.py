@@ -0,0 +1,237 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_hls_playlist_ready(path: str, min_segments: int = 3) -> bool:
+    """
+    Check if the hls playlist has enough segments and does not end with a discontinuity
+    """
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+    except OSError:
+        return False
+    return content.count("#EXTINF") >= min_segments and not content.rstrip().endswith("#EXT-X-DISCONTINUITY")
+
+
+class _Inotify:
+    """
+    Minimal inotify watch of a directory through libc, None is returned by create when it is not available
+    """
+
+    def __init__(self, libc, fd: int):
+        self.libc = libc
+        self.fd = fd
+        self.wd = -1
+
+    @classmethod
+    def create(cls) -> Optional["_Inotify"]:
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def watch(self, directory: str) -> bool:
+        if self.wd >= 0:
+            return True
+        if not os.path.isdir(directory):
+            return False
+        self.wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        )
+        return self.wd >= 0
+
+    def read_names(self, timeout: float) -> set:
+        """
+        Wait for the events up to the timeout and return the changed file names
+        """
+        names = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return names
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        pos = 0
+        while pos + INOTIFY_EVENT_HEADER.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT_HEADER.unpack_from(data, pos)
+            pos += INOTIFY_EVENT_HEADER.size
+            names.add(os.fsdecode(data[pos:pos + length].rstrip(b"\x00")))
+            pos += length
+        return names
+
+
+class HlsReadyNotifier:
+    """
+    Per channel readiness of the hls playlists, one watcher thread follows the playlist directory
+    (inotify when available, mtime polling otherwise) and releases all the waiters of a channel together
+    once its playlist has enough segments
+    """
+
+    def __init__(self, directory: str, min_segments: int = 3, poll_interval: float = 0.5):
+        self.directory = directory
+        self.min_segments = min_segments
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conditions: Dict[str, threading.Condition] = {}
+        self._waiters: Dict[str, int] = {}
+        self._futures: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._states: Dict[str, str] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._has_waiters = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify: Optional[_Inotify] = None
+
+    def get_path(self, channel_id: str) -> str:
+        return os.path.join(self.directory, f"{channel_id}.m3u8")
+
+    def _ensure_started(self) -> None:
+        if self._thread:
+            return
+        with self._lock:
+            if self._thread:
+                return
+            self._inotify = _Inotify.create()
+            self._thread = threading.Thread(target=self._watch, daemon=True, name="hls-ready-notifier")
+            self._thread.start()
+
+    def _check(self, channel_id: str) -> None:
+        """
+        Re-check the playlist of the channel if it changed, must be called with the lock held
+        """
+        path = self.get_path(channel_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        if self._mtimes.get(channel_id) == mtime:
+            return
+        self._mtimes[channel_id] = mtime
+        if is_hls_playlist_ready(path, self.min_segments):
+            self._set_state(channel_id, "ready")
+
+    @staticmethod
+    def _set_future(future: asyncio.Future, ready: bool) -> None:
+        if not future.done():
+            future.set_result(ready)
+
+    def _set_state(self, channel_id: str, state: str) -> None:
+        """
+        Set the final state of the current wait and release all its waiters, must be called with the lock held
+        """
+        self._states[channel_id] = state
+        self._conditions[channel_id].notify_all()
+        for loop, future in self._futures.pop(channel_id, []):
+            loop.call_soon_threadsafe(self._set_future, future, state == "ready")
+
+    def _register(self, channel_id: str) -> None:
+        """
+        Register a waiter of the channel, the first waiter resets the state, must be called with the lock held
+        """
+        if channel_id not in self._conditions:
+            self._conditions[channel_id] = threading.Condition(self._lock)
+        if not self._waiters.get(channel_id):
+            self._states.pop(channel_id, None)
+            self._mtimes.pop(channel_id, None)
+            self._check(channel_id)
+        self._waiters[channel_id] = self._waiters.get(channel_id, 0) + 1
+        self._has_waiters.set()
+
+    def _unregister(self, channel_id: str) -> None:
+        self._waiters[channel_id] -= 1
+        if not self._waiters[channel_id]:
+            del self._waiters[channel_id]
+            self._states.pop(channel_id, None)
+            self._mtimes.pop(channel_id, None)
+            self._futures.pop(channel_id, None)
+
+    def _watch(self) -> None:
+        while True:
+            self._has_waiters.wait()
+            names = None
+            if self._inotify and self._inotify.watch(self.directory):
+                try:
+                    names = self._inotify.read_names(self.poll_interval)
+                except OSError:
+                    names = None
+            else:
+                threading.Event().wait(self.poll_interval)
+            with self._lock:
+                for channel_id in list(self._waiters):
+                    if names and f"{channel_id}.m3u8" not in names:
+                        continue
+                    self._check(channel_id)
+                if not self._waiters:
+                    self._has_waiters.clear()
+
+    def wait_ready(self, channel_id: str, timeout: float) -> bool:
+        """
+        Block until the playlist of the channel is ready, the stream closed or the timeout expired,
+        return whether the playlist is ready
+        """
+        self._ensure_started()
+        with self._lock:
+            self._register(channel_id)
+            try:
+                self._conditions[channel_id].wait_for(lambda: channel_id in self._states, timeout)
+                return self._states.get(channel_id) == "ready"
+            finally:
+                self._unregister(channel_id)
+
+    async def wait_ready_async(self, channel_id: str, timeout: float) -> bool:
+        """
+        Asyncio version of wait_ready, the waiter holds no thread while waiting
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._register(channel_id)
+            if channel_id in self._states:
+                future.set_result(self._states[channel_id] == "ready")
+            else:
+                self._futures.setdefault(channel_id, []).append((asyncio.get_running_loop(), future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                futures = self._futures.get(channel_id)
+                if futures:
+                    self._futures[channel_id] = [item for item in futures if item[1] is not future]
+                self._unregister(channel_id)
+
+    def has_waiters(self, channel_id: str) -> bool:
+        """
+        Check if any request is waiting for the playlist of the channel
+        """
+        with self._lock:
+            return bool(self._waiters.get(channel_id))
+
+    def notify_closed(self, channel_id: str) -> None:
+        """
+        Release the waiters of the channel when its stream process exited
+        """
+        with self._lock:
+            if channel_id in self._waiters and channel_id not in self._states:
+                self._set_state(channel_id, "closed")
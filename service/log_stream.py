@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+from typing import Optional, Tuple
+
+LOG_CHUNK_SIZE = 64 * 1024
+FOLLOW_INTERVAL = 0.5
+FOLLOW_TIMEOUT = 300
+
+
+def get_tail_offset(path: str, lines: int, chunk_size: int = LOG_CHUNK_SIZE) -> int:
+    """
+    Get the offset of the last lines of the file by reading backwards from the end
+    """
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        if lines <= 0:
+            return end
+        pos = end
+        count = 0
+        skip_last = True
+        while pos > 0:
+            size = min(chunk_size, pos)
+            pos -= size
+            f.seek(pos)
+            chunk = f.read(size)
+            if skip_last:
+                if chunk.endswith(b"\n"):
+                    chunk = chunk[:-1]
+                skip_last = False
+            index = len(chunk)
+            while True:
+                index = chunk.rfind(b"\n", 0, index)
+                if index == -1:
+                    break
+                count += 1
+                if count == lines:
+                    return pos + index + 1
+        return 0
+
+
+def get_log_params(args, size: int) -> Tuple[Optional[int], bool]:
+    """
+    Get the start offset and the follow mode from the query args (tail=N, offset=N, follow=1),
+    a None offset means the whole file is requested and tail=0 or below starts from the end of the file
+    """
+    follow = args.get("follow", "").lower() in ("1", "true", "yes")
+    start = None
+    try:
+        if args.get("tail"):
+            tail = int(args.get("tail"))
+            start = -tail if tail > 0 else size
+        elif args.get("offset"):
+            start = max(0, int(args.get("offset")))
+    except ValueError:
+        start = None
+    if start is not None and start >= 0:
+        start = min(start, size)
+    if follow and start is None:
+        start = 0
+    return start, follow
+
+
+def resolve_start(path: str, start: int) -> int:
+    """
+    Resolve the negative start (the tail lines) to the byte offset
+    """
+    return get_tail_offset(path, -start) if start < 0 else start
+
+
+def iter_log(path: str, start: int, end: Optional[int] = None, chunk_size: int = LOG_CHUNK_SIZE):
+    """
+    Iterate the chunks of the file from the start to the end offset
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+async def follow_log_async(path: str, start: int, interval: float = FOLLOW_INTERVAL, timeout: float = FOLLOW_TIMEOUT):
+    """
+    Iterate the chunks of the file from the start and keep streaming the appended ones until the timeout,
+    the file is followed from the beginning again when it is truncated by a new run, it is read in the executor
+    """
+    loop = asyncio.get_running_loop()
+    pos = start
+    deadline = time.time() + timeout
+    while True:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = pos
+        if size < pos:
+            pos = 0
+        if size > pos:
+            with open(path, "rb") as f:
+                f.seek(pos)
+                while pos < size:
+                    chunk = await loop.run_in_executor(None, f.read, min(LOG_CHUNK_SIZE, size - pos))
+                    if not chunk:
+                        break
+                    pos += len(chunk)
+                    yield chunk
+        if time.time() >= deadline:
+            break
+        await asyncio.sleep(interval)
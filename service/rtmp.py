@@ -1,5 +1,6 @@
 import json
 import os
+import sqlite3
 import subprocess
 import sys
 import threading
@@ -7,6 +8,7 @@ import time
 from collections import OrderedDict
 
 import utils.constants as constants
+from service.hls_ready import HlsReadyNotifier
 from utils.config import config
 from utils.db import get_db_connection, return_db_connection
 from utils.i18n import t
@@ -22,15 +24,40 @@ app_rtmp_url = f"rtmp://127.0.0.1:{config.nginx_rtmp_port}"
 hls_running_streams = OrderedDict()
 STREAMS_LOCK = threading.Lock()
 hls_last_access = {}
+# channel id -> time of the last request or start, the stream is being waited on until it gets ready
+hls_last_request = {}
 HLS_IDLE_TIMEOUT = config.rtmp_idle_timeout
 HLS_WAIT_TIMEOUT = 30
-HLS_WAIT_INTERVAL = 0.5
+HLS_BUSY_WINDOW = 30
+HLS_MIN_SEGMENTS = 3
 MAX_STREAMS = config.rtmp_max_streams
+RTMP_TRANSCODE_COST = 1.0
+RTMP_AUDIO_TRANSCODE_COST = 0.2
+RTMP_COPY_COST = 0.1
+CODEC_CACHE_TTL = 24 * 3600
+CODEC_FAILURE_TTL = 10 * 60
+CODEC_PROBE_TIMEOUT = 10
+hls_stream_costs = {}
+hls_stream_urls = {}
+_codec_cache = {}
+_codec_probing = set()
+_codec_probing_lock = threading.Lock()
+PREWARM_COUNT = config.rtmp_prewarm_count
+PREWARM_BUDGET = config.rtmp_prewarm_budget
+HLS_PREWARM_INTERVAL = 60
+HLS_ACCESS_HALF_LIFE = 3 * 24 * 3600
+# url -> (decaying access score, updated_at), keyed by url since the channel ids change between runs
+hls_access_scores = {}
+_access_changed = set()
+hls_warm_channels = set()
+_warm_stats = {"start": 0, "hit": 0}
 nginx_dir = resource_path(os.path.join('utils', 'nginx-rtmp-win32'))
 hls_temp_path = resource_path(os.path.join(nginx_dir, 'temp', 'hls')) if sys.platform == "win32" else '/tmp/hls'
+hls_ready_notifier = HlsReadyNotifier(hls_temp_path, min_segments=HLS_MIN_SEGMENTS)
 
 _hls_monitor_started_evt = threading.Event()
 _hls_monitor_lock = threading.Lock()
+_hls_prewarm_started_evt = threading.Event()
 
 
 def ensure_hls_idle_monitor_started():
@@ -50,6 +77,21 @@ def ensure_hls_idle_monitor_started():
             print(t("msg.rtmp_hls_idle_monitor_start_fail").format(info=e))
 
 
+def ensure_hls_prewarm_started():
+    if _hls_prewarm_started_evt.is_set() or not config.open_rtmp or PREWARM_COUNT <= 0:
+        return
+    with _hls_monitor_lock:
+        if _hls_prewarm_started_evt.is_set():
+            return
+        try:
+            thread = threading.Thread(target=hls_prewarm_monitor, daemon=True, name="hls-prewarm-monitor")
+            thread.start()
+            _hls_prewarm_started_evt.set()
+            print(t("msg.rtmp_hls_prewarm_start_success").format(count=PREWARM_COUNT, budget=PREWARM_BUDGET))
+        except Exception as e:
+            print(t("msg.rtmp_hls_prewarm_start_fail").format(info=e))
+
+
 def start_hls_to_rtmp(host, channel_id):
     ensure_hls_idle_monitor_started()
 
@@ -71,9 +113,12 @@ def start_hls_to_rtmp(host, channel_id):
             else:
                 del hls_running_streams[channel_id]
 
-    cleanup_streams(hls_running_streams)
-
     headers = data.get("headers", None)
+    source_url = url.partition('$')[0]
+    codec_args, cost, mode = get_codec_args(get_stream_codecs(source_url, headers))
+    if not cleanup_streams(hls_running_streams, reserve=cost):
+        return print(t("msg.rtmp_hls_budget_exhausted").format(channel_id=channel_id))
+
     headers_str = ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) if headers else ''
     cmd = [
         'ffmpeg',
@@ -85,13 +130,8 @@ def start_hls_to_rtmp(host, channel_id):
         cmd += ['-headers', headers_str]
 
     cmd += [
-        '-i', url.partition('$')[0],
-        '-c:v', 'libx264',
-        '-preset', 'veryfast',
-        '-tune', 'zerolatency',
-        '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
-        '-c:a', 'aac',
-        '-b:a', '128k',
+        '-i', source_url,
+        *codec_args,
         '-f', 'flv',
         '-flvflags', 'no_duration_filesize',
         join_url(host, channel_id)
@@ -103,7 +143,7 @@ def start_hls_to_rtmp(host, channel_id):
             stderr=subprocess.DEVNULL,
             stdin=subprocess.DEVNULL
         )
-        print(t("msg.rtmp_publish").format(channel_id=channel_id, source=url))
+        print(t("msg.rtmp_publish").format(channel_id=channel_id, source=url, mode=mode))
     except Exception as e:
         return print(t("msg.error_start_ffmpeg_failed").format(info=e))
 
@@ -115,6 +155,132 @@ def start_hls_to_rtmp(host, channel_id):
 
     with STREAMS_LOCK:
         hls_running_streams[channel_id] = process
+        hls_stream_costs[channel_id] = cost
+        hls_stream_urls[channel_id] = url
+        hls_last_request[channel_id] = time.time()
+
+
+def probe_stream_codecs(url, headers=None):
+    """
+    Probe the first video and audio codec of the url by ffprobe, None if the probe failed
+    """
+    cmd = ['ffprobe', '-v', 'error']
+    if headers:
+        cmd += ['-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items())]
+    cmd += ['-show_entries', 'stream=codec_type,codec_name', '-of', 'json', url]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=CODEC_PROBE_TIMEOUT)
+        streams = json.loads(result.stdout.decode('utf-8') or '{}').get('streams') or []
+    except Exception:
+        return None
+    video = next((item.get('codec_name') for item in streams if item.get('codec_type') == 'video'), None)
+    audio = next((item.get('codec_name') for item in streams if item.get('codec_type') == 'audio'), None)
+    return (video, audio) if video else None
+
+
+def is_codec_fresh(video, updated_at, now):
+    return now - updated_at < (CODEC_CACHE_TTL if video else CODEC_FAILURE_TTL)
+
+
+def get_cached_codecs(url):
+    """
+    Get the codecs of the url from the memory or rtmp db cache, return (hit, codecs),
+    a failed probe is only cached for a short while
+    """
+    now = int(time.time())
+    cached = _codec_cache.get(url)
+    if cached and is_codec_fresh(cached[0], cached[2], now):
+        return True, cached[:2] if cached[0] else None
+    conn = get_db_connection(constants.rtmp_data_path, readonly=True)
+    if conn is None:
+        return False, None
+    try:
+        row = conn.execute("SELECT video, audio, updated_at FROM codec_data WHERE url=?", (url,)).fetchone()
+        if row and is_codec_fresh(row[0], row[2], now):
+            _codec_cache[url] = row
+            return True, row[:2] if row[0] else None
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        return_db_connection(constants.rtmp_data_path, conn)
+    return False, None
+
+
+def probe_and_cache_codecs(url, headers=None):
+    """
+    Probe the codecs of the url and save them to the memory and rtmp db cache
+    """
+    try:
+        now = int(time.time())
+        video, audio = probe_stream_codecs(url, headers) or (None, None)
+        _codec_cache[url] = (video, audio, now)
+        conn = get_db_connection(constants.rtmp_data_path)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS codec_data "
+                    "(url TEXT PRIMARY KEY, video TEXT, audio TEXT, updated_at INTEGER)"
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO codec_data (url, video, audio, updated_at) VALUES (?, ?, ?, ?)",
+                    (url, video, audio, now)
+                )
+        except Exception:
+            pass
+        finally:
+            return_db_connection(constants.rtmp_data_path, conn)
+    finally:
+        with _codec_probing_lock:
+            _codec_probing.discard(url)
+
+
+def get_stream_codecs(url, headers=None):
+    """
+    Get the cached codecs of the url without waiting for a probe, on a cache miss the url is probed in the
+    background and None is returned, so the stream starts transcoding and the later starts can remux
+    """
+    hit, codecs = get_cached_codecs(url)
+    if hit:
+        return codecs
+    with _codec_probing_lock:
+        if url in _codec_probing:
+            return None
+        _codec_probing.add(url)
+    threading.Thread(target=probe_and_cache_codecs, args=(url, headers), daemon=True, name="codec-probe").start()
+    return None
+
+
+def get_codec_args(codecs):
+    """
+    Get the ffmpeg codec args, the cpu cost and the mode of the stream, the source is remuxed when it is already
+    h264/aac, only the audio is transcoded when the video is h264 and everything is transcoded otherwise
+    """
+    video, audio = codecs or (None, None)
+    if video != 'h264':
+        return [
+            '-c:v', 'libx264',
+            '-preset', 'veryfast',
+            '-tune', 'zerolatency',
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+            '-c:a', 'aac',
+            '-b:a', '128k',
+        ], RTMP_TRANSCODE_COST, 'transcode'
+    args = ['-map', '0:v:0', '-map', '0:a:0?', '-c:v', 'copy']
+    if audio is None:
+        return args, RTMP_COPY_COST, 'copy'
+    if audio == 'aac':
+        return args + ['-c:a', 'copy', '-bsf:a', 'aac_adtstoasc'], RTMP_COPY_COST, 'copy'
+    return args + ['-c:a', 'aac', '-b:a', '128k'], RTMP_AUDIO_TRANSCODE_COST, 'copy+aac'
+
+
+def get_streams_cost(streams):
+    return sum(hls_stream_costs.get(channel_id, RTMP_TRANSCODE_COST) for channel_id in streams)
+
+
+def is_stream_running(channel_id):
+    with STREAMS_LOCK:
+        process = hls_running_streams.get(channel_id)
+        return process is not None and process.poll() is None
 
 
 def _terminate_process_safe(process):
@@ -129,21 +295,82 @@ def _terminate_process_safe(process):
             pass
 
 
-def cleanup_streams(streams):
+def mark_stream_requested(channel_id):
+    """
+    Mark the stream as requested before waiting for its playlist, so it is not evicted while it starts
+    """
+    with STREAMS_LOCK:
+        hls_last_request[channel_id] = time.time()
+
+
+def get_last_active(channel_id):
+    """
+    Get the last active time of the stream, a requested or started stream counts as active until the wait timeout
+    """
+    return max(hls_last_access.get(channel_id, 0), hls_last_request.get(channel_id, 0) + HLS_WAIT_TIMEOUT)
+
+
+def is_stream_busy(channel_id, now):
+    """
+    Check if the stream is watched within the busy window or is not ready yet while it is waited on or starting
+    """
+    return now - get_last_active(channel_id) <= HLS_BUSY_WINDOW or hls_ready_notifier.has_waiters(channel_id)
+
+
+def get_eviction_key(channel_id, now):
+    """
+    Get the eviction order key of the stream, the warm streams go last,
+    then the least recently active and the least frequently accessed go first
+    """
+    url = hls_stream_urls.get(channel_id)
+    score = get_decayed_score(*hls_access_scores[url], now) if url in hls_access_scores else 0.0
+    return channel_id in hls_warm_channels, get_last_active(channel_id), score
+
+
+def _forget_stream(channel_id):
+    """
+    Drop the accounting of the stream, must be called with the streams lock held
+    """
+    hls_stream_costs.pop(channel_id, None)
+    hls_stream_urls.pop(channel_id, None)
+    hls_last_request.pop(channel_id, None)
+    hls_warm_channels.discard(channel_id)
+
+
+def _terminate_in_background(processes):
+    for process in processes:
+        threading.Thread(target=_terminate_process_safe, args=(process,), daemon=True).start()
+
+
+def cleanup_streams(streams, reserve=0.0):
+    """
+    Remove the exited streams and evict the idle ones until the cpu cost of the running streams
+    and the reserved cost fit in the budget, a transcoding stream costs one unit of rtmp_max_streams,
+    the busy streams (watched within the busy window, or starting and not ready yet) are never evicted, nothing is evicted when the reserved cost
+    can not fit anyway and the processes are terminated outside the lock, return whether the reserved cost fits
+    """
+    now = time.time()
+    evicted = []
     with STREAMS_LOCK:
-        to_delete = []
         for channel_id, process in list(streams.items()):
             if process.poll() is not None:
-                to_delete.append(channel_id)
-        for channel_id in to_delete:
-            streams.pop(channel_id, None)
+                streams.pop(channel_id, None)
+                _forget_stream(channel_id)
 
-        while len(streams) > MAX_STREAMS:
-            try:
-                oldest_channel_id, oldest_proc = streams.popitem(last=False)
-                _terminate_process_safe(oldest_proc)
-            except KeyError:
-                break
+        cost = get_streams_cost(streams)
+        candidates = [channel_id for channel_id in streams if not is_stream_busy(channel_id, now)]
+        if MAX_STREAMS < cost + reserve <= MAX_STREAMS + get_streams_cost(candidates):
+            candidates.sort(key=lambda channel_id: get_eviction_key(channel_id, now))
+            for channel_id in candidates:
+                if get_streams_cost(streams) + reserve <= MAX_STREAMS:
+                    break
+                evicted.append(streams.pop(channel_id))
+                _forget_stream(channel_id)
+                hls_last_access.pop(channel_id, None)
+        fits = get_streams_cost(streams) + reserve <= MAX_STREAMS
+
+    _terminate_in_background(evicted)
+    return fits
 
 
 def monitor_stream_process(streams, process, channel_id):
@@ -154,6 +381,8 @@ def monitor_stream_process(streams, process, channel_id):
     with STREAMS_LOCK:
         if channel_id in streams and streams[channel_id] is process:
             del streams[channel_id]
+            _forget_stream(channel_id)
+    hls_ready_notifier.notify_closed(channel_id)
 
 
 def hls_idle_monitor():
@@ -163,6 +392,8 @@ def hls_idle_monitor():
 
         with STREAMS_LOCK:
             for channel_id, last_ts in list(hls_last_access.items()):
+                if channel_id in hls_warm_channels:
+                    continue
                 proc = hls_running_streams.get(channel_id)
                 if proc and proc.poll() is None:
                     if now - last_ts > HLS_IDLE_TIMEOUT:
@@ -178,34 +409,218 @@ def hls_idle_monitor():
         time.sleep(5)
 
 
-def get_channel_data(channel_id):
+def get_decayed_score(score, updated_at, now):
+    return score * 0.5 ** ((now - updated_at) / HLS_ACCESS_HALF_LIFE)
+
+
+def record_channel_access(channel_id, warm):
+    """
+    Record the request of the channel, a request after the idle timeout starts a new viewing session,
+    which counts as an access of the channel and as a warm start hit when its stream was already running
+    """
+    now = time.time()
+    with STREAMS_LOCK:
+        last_ts = hls_last_access.get(channel_id)
+        hls_last_access[channel_id] = now
+        if last_ts is not None and now - last_ts <= HLS_IDLE_TIMEOUT:
+            return
+        _warm_stats["start"] += 1
+        if warm:
+            _warm_stats["hit"] += 1
+    if PREWARM_COUNT <= 0:
+        return
+    url = get_channel_data(channel_id).get("url")
+    if not url:
+        return
+    with STREAMS_LOCK:
+        score, updated_at = hls_access_scores.get(url, (0.0, now))
+        hls_access_scores[url] = (get_decayed_score(score, updated_at, now) + 1, now)
+        _access_changed.add(url)
+
+
+def get_warm_stats():
+    start, hit = _warm_stats["start"], _warm_stats["hit"]
+    return {"start": start, "hit": hit, "rate": hit / start if start else 0.0}
+
+
+def _ensure_access_table(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS channel_access (url TEXT PRIMARY KEY, score REAL, updated_at REAL)")
+
+
+def load_access_scores():
     conn = get_db_connection(constants.rtmp_data_path)
-    channel_data = {}
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT url, headers FROM result_data WHERE id=?", (channel_id,))
-        data = cursor.fetchone()
-        if data:
-            channel_data = {
-                'url': data[0],
-                'headers': json.loads(data[1]) if data[1] else None
-            }
+        _ensure_access_table(conn)
+        rows = conn.execute("SELECT url, score, updated_at FROM channel_access").fetchall()
+        with STREAMS_LOCK:
+            for url, score, updated_at in rows:
+                hls_access_scores.setdefault(url, (score, updated_at))
     except Exception as e:
         print(t("msg.error_get_channel_data_from_database").format(info=e))
     finally:
         return_db_connection(constants.rtmp_data_path, conn)
-    return channel_data
 
 
-def stop_stream(channel_id):
+def save_access_scores():
+    """
+    Save the changed access scores and drop the ones decayed below a hundredth of an access
+    """
+    now = time.time()
     with STREAMS_LOCK:
-        process = hls_running_streams.get(channel_id)
-        if process and process.poll() is None:
+        expired = [url for url, item in hls_access_scores.items() if get_decayed_score(*item, now) < 0.01]
+        for url in expired:
+            hls_access_scores.pop(url, None)
+        changed = [(url, *hls_access_scores[url]) for url in _access_changed if url in hls_access_scores]
+        _access_changed.clear()
+    if not changed and not expired:
+        return
+    conn = get_db_connection(constants.rtmp_data_path)
+    try:
+        _ensure_access_table(conn)
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO channel_access (url, score, updated_at) VALUES (?, ?, ?)", changed)
+            conn.executemany("DELETE FROM channel_access WHERE url=?", [(url,) for url in expired])
+    except Exception as e:
+        print(t("msg.error_get_channel_data_from_database").format(info=e))
+    finally:
+        return_db_connection(constants.rtmp_data_path, conn)
+
+
+def get_channel_ids_by_url():
+    return {url: channel_id for channel_id, (url, _) in channel_data_cache.items()}
+
+
+def prewarm_streams():
+    """
+    Keep the streams of the top accessed channels running within the prewarm cpu budget, the warm channels are exempt
+    from the idle stop and the ones that left the top list are handed back to the idle monitor
+    """
+    now = time.time()
+    channel_ids = get_channel_ids_by_url()
+    with STREAMS_LOCK:
+        ranked = sorted(
+            (url for url in hls_access_scores if url in channel_ids),
+            key=lambda url: get_decayed_score(*hls_access_scores[url], now),
+            reverse=True
+        )[:PREWARM_COUNT]
+        targets = [str(channel_ids[url]) for url in ranked]
+        for channel_id in hls_warm_channels - set(targets):
+            hls_warm_channels.discard(channel_id)
+            hls_last_access.setdefault(channel_id, now)
+        hls_warm_channels.intersection_update(hls_running_streams)
+        warm_cost = get_streams_cost(hls_warm_channels)
+    host = f"{app_rtmp_url}/hls"
+    for channel_id in targets:
+        with STREAMS_LOCK:
+            if channel_id in hls_warm_channels:
+                continue
+            proc = hls_running_streams.get(channel_id)
+            if proc and proc.poll() is None:
+                hls_warm_channels.add(channel_id)
+                warm_cost += hls_stream_costs.get(channel_id, RTMP_TRANSCODE_COST)
+                continue
+        data = get_channel_data(channel_id)
+        if not data.get("url"):
+            continue
+        _, cost, _ = get_codec_args(get_stream_codecs(data["url"].partition('$')[0], data.get("headers")))
+        with STREAMS_LOCK:
+            if warm_cost + cost > PREWARM_BUDGET or get_streams_cost(hls_running_streams) + cost > MAX_STREAMS:
+                continue
+        start_hls_to_rtmp(host, channel_id)
+        with STREAMS_LOCK:
+            if channel_id in hls_running_streams:
+                hls_warm_channels.add(channel_id)
+                warm_cost += cost
+
+
+def hls_prewarm_monitor():
+    load_access_scores()
+    while True:
+        try:
+            save_access_scores()
+            prewarm_streams()
+            stats = get_warm_stats()
+            if stats["start"]:
+                print(t("msg.rtmp_hls_prewarm_stats").format(
+                    warm=len(hls_warm_channels), start=stats["start"], hit=stats["hit"], rate=f"{stats['rate']:.1%}"
+                ))
+        except Exception as e:
+            print(t("msg.rtmp_hls_prewarm_start_fail").format(info=e))
+        time.sleep(HLS_PREWARM_INTERVAL)
+
+
+class ChannelDataCache:
+    """
+    In-memory id -> (url, headers) map of the rtmp db result data, the map is reloaded only when
+    the data version of the db changes, which is checked at most once per check interval
+    """
+
+    def __init__(self, db_path, check_interval=1.0):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._data = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.time()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            if not os.path.exists(self.db_path):
+                return
             try:
-                _terminate_process_safe(process)
+                if self._conn is None:
+                    self._conn = sqlite3.connect(
+                        f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True, check_same_thread=False
+                    )
+                version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if version == self._version:
+                    return
+                rows = self._conn.execute("SELECT id, url, headers FROM result_data").fetchall()
+                self._data = {
+                    str(channel_id): (url, json.loads(headers) if headers else None)
+                    for channel_id, url, headers in rows
+                }
+                self._version = version
+            except sqlite3.OperationalError:
+                self._data = {}
             except Exception as e:
-                print(t("msg.error_stop_channel_stream").format(channel_id=channel_id, info=e))
-        hls_running_streams.pop(channel_id, None)
+                print(t("msg.error_get_channel_data_from_database").format(info=e))
+
+    def get(self, channel_id):
+        self._refresh()
+        return self._data.get(str(channel_id))
+
+    def items(self):
+        self._refresh()
+        return self._data.items()
+
+
+channel_data_cache = ChannelDataCache(constants.rtmp_data_path)
+
+
+def get_channel_data(channel_id):
+    data = channel_data_cache.get(channel_id)
+    if not data:
+        return {}
+    return {'url': data[0], 'headers': data[1]}
+
+
+def stop_stream(channel_id):
+    with STREAMS_LOCK:
+        process = hls_running_streams.pop(channel_id, None)
+        _forget_stream(channel_id)
+    if process and process.poll() is None:
+        try:
+            _terminate_process_safe(process)
+        except Exception as e:
+            print(t("msg.error_stop_channel_stream").format(channel_id=channel_id, info=e))
 
 
 def start_rtmp_service():
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.db import SQLitePool
+
+
+def create_table(conn, rows):
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS t (a INTEGER)")
+        conn.executemany("INSERT INTO t (a) VALUES (?)", [(row,) for row in rows])
+
+
+def count_rows(conn):
+    return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+def test_readonly_connection_is_none_before_the_db_exists(tmp_path):
+    pool = SQLitePool(str(tmp_path / "missing.db"))
+    assert pool.get_connection(readonly=True) is None
+    assert pool.get_stats()["write"] == 0
+
+
+def test_readonly_connection_rejects_writes(tmp_path):
+    pool = SQLitePool(str(tmp_path / "test.db"))
+    with pool.connection() as conn:
+        create_table(conn, [1])
+    with pool.connection(readonly=True) as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO t (a) VALUES (2)")
+    stats = pool.get_stats()
+    assert stats["write"] == 1 and stats["read"] == 1
+    pool.close_all()
+
+
+def test_returned_reader_does_not_keep_a_stale_snapshot(tmp_path):
+    pool = SQLitePool(str(tmp_path / "test.db"), pool_size=1)
+    with pool.connection() as conn:
+        create_table(conn, [1])
+    reader = pool.get_connection(readonly=True)
+    reader.execute("BEGIN")
+    assert count_rows(reader) == 1
+    pool.return_connection(reader)
+    with pool.connection() as conn:
+        create_table(conn, [2])
+    with pool.connection(readonly=True) as conn:
+        assert not conn.in_transaction
+        assert count_rows(conn) == 2
+    pool.close_all()
+
+
+def test_run_uses_the_executor_and_sees_all_writes(tmp_path):
+    pool = SQLitePool(str(tmp_path / "test.db"))
+
+    async def main():
+        await asyncio.gather(*(pool.run(create_table, [i]) for i in range(20)))
+        return await pool.run(count_rows, readonly=True)
+
+    assert asyncio.run(main()) == 20
+    assert pool.get_stats()["write"] == 20
+    pool.close_all()
+
+
+def test_probe_store_async_round_trip(tmp_path):
+    import utils.probe_store as probe_store
+
+    if not probe_store.is_enabled():
+        pytest.skip("speed test cache is disabled")
+    path = str(tmp_path / "probe.db")
+
+    async def main():
+        await probe_store.load_async(path)
+        probe_store.add_result("http://a/1", "a", {"speed": 2.0, "delay": 100})
+        await probe_store.save_async(path)
+        await probe_store.load_async(path)
+        return probe_store.get_fresh_result("http://a/1")
+
+    result = asyncio.run(main())
+    assert result["speed"] == 2.0 and result["delay"] == 100
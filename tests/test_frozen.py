@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils.frozen as frozen
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    now = [1_000_000]
+    monkeypatch.setattr(frozen, "_now_ts", lambda: now[0])
+    for state in (frozen._frozen, frozen._heap, frozen._frozen_urls, frozen._changed, frozen._removed):
+        state.clear()
+    yield now
+    for state in (frozen._frozen, frozen._heap, frozen._frozen_urls, frozen._changed, frozen._removed):
+        state.clear()
+
+
+def read_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {
+            url: (bad_count, last_bad, frozen_until)
+            for url, bad_count, last_bad, frozen_until in
+            conn.execute("SELECT url, bad_count, last_bad, frozen_until FROM frozen_url")
+        }
+    finally:
+        conn.close()
+
+
+def write_row(path, url, bad_count, last_bad, frozen_until):
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO frozen_url (url, bad_count, last_bad, last_good, frozen_until) "
+                "VALUES (?, ?, ?, 0, ?)",
+                (url, bad_count, last_bad, frozen_until)
+            )
+    finally:
+        conn.close()
+
+
+def test_urls_are_released_in_backoff_order(clock):
+    frozen.mark_url_bad("a")
+    frozen.mark_url_bad("b")
+    frozen.mark_url_bad("b")
+    frozen.mark_url_bad("c", initial=True)
+    assert frozen.get_current_frozen_set() == {"a", "b", "c"}
+    clock[0] += 2 * frozen.BASE_BACKOFF
+    assert frozen.get_current_frozen_set() == {"b", "c"}
+    clock[0] += 2 * frozen.BASE_BACKOFF
+    assert frozen.get_current_frozen_set() == {"c"}
+    clock[0] += frozen.MAX_BACKOFF
+    assert frozen.get_current_frozen_set() == set()
+    assert "a" not in frozen._frozen
+    assert frozen._frozen["b"]["bad_count"] == 1
+
+
+def test_refrozen_url_ignores_its_stale_heap_entry(clock):
+    frozen.mark_url_bad("a")
+    clock[0] += frozen.BASE_BACKOFF
+    frozen.mark_url_bad("a")
+    clock[0] += frozen.BASE_BACKOFF + 1
+    assert frozen.get_current_frozen_set() == {"a"}
+    assert frozen._frozen["a"]["bad_count"] == 2
+    assert frozen.is_url_frozen("a")
+
+
+def test_save_writes_only_the_changed_urls(tmp_path, clock):
+    path = str(tmp_path / "frozen.db")
+    frozen.mark_url_bad("a")
+    frozen.mark_url_bad("b")
+    frozen.save(path)
+    assert set(read_rows(path)) == {"a", "b"}
+    assert not frozen._changed and not frozen._removed
+    write_row(path, "b", 99, 0, None)
+    frozen.mark_url_good("a")
+    frozen.mark_url_bad("c")
+    frozen.save(path)
+    rows = read_rows(path)
+    assert set(rows) == {"b", "c"}
+    assert rows["b"][0] == 99
+
+
+def test_bad_count_history_is_kept_after_the_freeze_expired(tmp_path, clock):
+    path = str(tmp_path / "frozen.db")
+    frozen.mark_url_bad("a", initial=True)
+    frozen.save(path)
+    frozen._frozen.clear()
+    frozen._frozen_urls.clear()
+    frozen._heap.clear()
+    clock[0] += 30 * 24 * 3600
+    frozen.load(path)
+    frozen.save(path)
+    assert read_rows(path)["a"][0] == 3
+    assert not frozen.is_url_frozen("a")
+    frozen.mark_url_bad("a")
+    assert frozen._frozen["a"]["bad_count"] == 4
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.limiter import AdaptiveLimiter
+
+MB = 1024 * 1024
+
+
+def test_window_throughput_counts_the_bytes_received_in_the_window():
+    received = [0]
+    limiter = AdaptiveLimiter(limit=2, max_limit=8, adaptive=True, interval=2.0)
+    asyncio.run(limiter.start(lambda: received[0]))
+    for _ in range(5):
+        received[0] += 2 * MB
+        limiter._adjust(0.0)
+        assert limiter._throughput == 1.0
+    # a 10s probe finished in this window, only the bytes that arrived in it are counted
+    received[0] += 2 * MB
+    limiter.record({"speed": 1.0, "delay": 100}, 10.0)
+    limiter._adjust(0.0)
+    assert limiter._throughput == 1.0
+
+
+def test_window_without_a_counter_counts_the_finished_probes():
+    limiter = AdaptiveLimiter(limit=2, max_limit=8, adaptive=True, interval=2.0)
+    limiter.record({"speed": 1.0, "delay": 100}, 4.0)
+    limiter._adjust(0.0)
+    assert limiter._throughput == 2.0
+
+
+def test_window_with_bytes_and_no_finished_probe_can_raise_the_limit():
+    received = [0]
+    limiter = AdaptiveLimiter(limit=1, max_limit=8, adaptive=True, interval=2.0)
+
+    async def run():
+        await limiter.start(lambda: received[0])
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        received[0] += MB
+        limiter._adjust(0.0)
+        await asyncio.sleep(0)
+        assert waiter.done()
+
+    asyncio.run(run())
+    assert limiter.limit == 2
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from service.log_stream import get_log_params, get_tail_offset, iter_log, resolve_start
+
+
+def write_log(tmp_path, content=b"a\nb\nc\n"):
+    path = tmp_path / "test.log"
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_tail_returns_the_last_lines(tmp_path):
+    path = write_log(tmp_path)
+    start, follow = get_log_params({"tail": "2"}, 6)
+    assert not follow
+    assert b"".join(iter_log(path, resolve_start(path, start), 6)) == b"b\nc\n"
+
+
+def test_tail_zero_or_negative_starts_from_the_end(tmp_path):
+    path = write_log(tmp_path)
+    for tail in ("0", "-3"):
+        start, _ = get_log_params({"tail": tail}, 6)
+        assert start == 6
+        assert b"".join(iter_log(path, resolve_start(path, start), 6)) == b""
+
+
+def test_tail_more_than_the_lines_returns_the_whole_file(tmp_path):
+    path = write_log(tmp_path)
+    assert get_tail_offset(path, 10) == 0
+
+
+def test_offset_is_clamped_to_the_size():
+    assert get_log_params({"offset": "100"}, 6) == (6, False)
+    assert get_log_params({}, 6) == (None, False)
+    assert get_log_params({"follow": "1"}, 6) == (0, True)
@@ -0,0 +1,110 @@
+import os
+import random
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils.matcher as matcher
+from utils.matcher import KeywordMatcher, get_keyword_matcher
+from utils.tools import check_url_by_keywords
+from utils.whitelist import WhitelistMatcher, is_url_whitelisted
+
+
+def naive_search(keywords, text):
+    return any(keyword in text for keyword in keywords)
+
+
+def naive_whitelisted(data_map, url, channel_name=None):
+    exact_map, keyword_map = data_map
+    channel_key = channel_name or ""
+    for key in (channel_key, ""):
+        if any(candidate and candidate.strip() == url for candidate in exact_map.get(key, [])):
+            return True
+    return any(kw and kw in url for kw in keyword_map.get(channel_key, []) + keyword_map.get("", []))
+
+
+def random_text(rng, length):
+    return "".join(rng.choice("abc./:") for _ in range(length))
+
+
+def test_automaton_matches_naive_search():
+    rng = random.Random(0)
+    for count in (1, 5, 100, 400):
+        keywords = [random_text(rng, rng.randint(1, 6)) for _ in range(count)]
+        keyword_matcher = KeywordMatcher(keywords)
+        assert (keyword_matcher._goto is not None) == (len(set(keywords)) >= matcher.AHO_CORASICK_MIN_KEYWORDS)
+        for _ in range(300):
+            text = random_text(rng, rng.randint(0, 30))
+            assert keyword_matcher.search(text) == naive_search(keywords, text)
+
+
+def test_automaton_on_small_lists(monkeypatch):
+    monkeypatch.setattr(matcher, "AHO_CORASICK_MIN_KEYWORDS", 1)
+    cases = [
+        (["he", "she", "his", "hers"], ["ushers", "ahishe", "xyz", "h", "hes", ""]),
+        (["abcd", "bc"], ["abce", "xbcx", "abc"]),
+        (["aab", "ab"], ["aaab", "aa", "ba"]),
+    ]
+    for keywords, texts in cases:
+        keyword_matcher = KeywordMatcher(keywords)
+        assert keyword_matcher._goto is not None
+        for text in texts:
+            assert keyword_matcher.search(text) == naive_search(keywords, text)
+
+
+def test_empty_keyword_matches_all():
+    keyword_matcher = KeywordMatcher(["", "abc"])
+    assert keyword_matcher.match_all
+    assert keyword_matcher.search("http://example.com")
+    assert keyword_matcher.search("")
+    assert len(keyword_matcher) == 1
+    assert check_url_by_keywords("http://example.com", ["", "abc"])
+    assert not check_url_by_keywords("http://example.com", [])
+
+
+def test_keyword_matcher_is_reused_for_the_same_list():
+    keywords = ["abc"]
+    keyword_matcher = get_keyword_matcher(keywords)
+    assert get_keyword_matcher(keywords) is keyword_matcher
+    keywords.append("xyz")
+    assert get_keyword_matcher(keywords) is not keyword_matcher
+    assert get_keyword_matcher(keywords).search("http://xyz.com")
+
+
+def test_whitelist_exact_entries_are_stripped():
+    exact = defaultdict(list, {"CCTV1": ["  http://a.com/1.m3u8 \t"], "": [" http://g.com/live "]})
+    data_map = (exact, defaultdict(list))
+    assert is_url_whitelisted(data_map, "http://a.com/1.m3u8", "CCTV1")
+    assert is_url_whitelisted(data_map, "http://g.com/live", "CCTV1")
+    assert is_url_whitelisted(data_map, "http://g.com/live")
+    assert not is_url_whitelisted(data_map, "http://a.com/1.m3u8", "CCTV2")
+    assert not is_url_whitelisted(data_map, " http://g.com/live ")
+
+
+def test_whitelist_merges_channel_and_global_keywords():
+    keywords = defaultdict(list, {"CCTV1": ["cctv1.cdn"], "": ["global.cdn", ""]})
+    data_map = (defaultdict(list), keywords)
+    whitelist_matcher = WhitelistMatcher(data_map)
+    assert whitelist_matcher.is_whitelisted("http://cctv1.cdn/live", "CCTV1")
+    assert whitelist_matcher.is_whitelisted("http://global.cdn/live", "CCTV1")
+    assert whitelist_matcher.is_whitelisted("http://global.cdn/live", "CCTV2")
+    assert whitelist_matcher.is_whitelisted("http://global.cdn/live")
+    assert not whitelist_matcher.is_whitelisted("http://cctv1.cdn/live", "CCTV2")
+    assert not whitelist_matcher.is_whitelisted("http://cctv1.cdn/live")
+    assert not whitelist_matcher.is_whitelisted("http://other.cdn/live", "CCTV1")
+
+
+def test_whitelist_matches_naive_lookup():
+    rng = random.Random(1)
+    channels = ["CCTV1", "CCTV2", ""]
+    exact = defaultdict(list)
+    keywords = defaultdict(list)
+    for _ in range(100):
+        exact[rng.choice(channels)].append(" " + random_text(rng, rng.randint(1, 4)) + " ")
+        keywords[rng.choice(channels)].append(random_text(rng, rng.randint(2, 5)))
+    data_map = (exact, keywords)
+    for _ in range(500):
+        url = random_text(rng, rng.randint(1, 12))
+        channel_name = rng.choice(channels + ["CCTV3", None])
+        assert is_url_whitelisted(data_map, url, channel_name) == naive_whitelisted(data_map, url, channel_name)
@@ -0,0 +1,172 @@
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.media_info import (
+    get_flv_video_size,
+    get_resolution_from_bytes,
+    get_size_from_nal_units,
+    get_ts_video_size,
+    parse_h264_sps,
+    parse_hevc_sps,
+)
+
+# 1920x1080 high profile sps of x264, cropped from 1088 by the frame cropping
+X264_SPS = bytes.fromhex("67640028acd940780227e5c044000003000400000300f03c60c658")
+# 1920x1080 main profile sps of x265
+X265_SPS = bytes.fromhex(
+    "420101016000000300900000030000030078a003c08010e596566924cae010000003001000000301e080"
+)
+
+
+class BitWriter:
+    def __init__(self):
+        self.bits = []
+
+    def u(self, count, value):
+        self.bits.extend((value >> (count - 1 - i)) & 1 for i in range(count))
+        return self
+
+    def ue(self, value):
+        value += 1
+        return self.u(value.bit_length() - 1, 0).u(value.bit_length(), value)
+
+    def se(self, value):
+        return self.ue(2 * value - 1 if value > 0 else -2 * value)
+
+    def to_bytes(self):
+        bits = self.bits + [1]
+        bits += [0] * (-len(bits) % 8)
+        data = bytes(
+            int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)
+        )
+        out = bytearray()
+        zeros = 0
+        for byte in data:
+            if zeros >= 2 and byte <= 3:
+                out.append(3)
+                zeros = 0
+            out.append(byte)
+            zeros = zeros + 1 if byte == 0 else 0
+        return bytes(out)
+
+
+def build_h264_scaling_sps():
+    """
+    1920x1080 high profile sps with a 4x4 list ended early by a zero scale and a full 8x8 list
+    """
+    writer = BitWriter().u(8, 100).u(16, 0x0028).ue(0)
+    writer.ue(1).ue(0).ue(0).u(1, 0)
+    writer.u(1, 1)
+    for i in range(8):
+        if i == 0:
+            writer.u(1, 1).se(4).se(-12)
+        elif i == 6:
+            writer.u(1, 1)
+            for _ in range(64):
+                writer.se(0)
+        else:
+            writer.u(1, 0)
+    writer.ue(0).ue(0).ue(2).ue(4).u(1, 0)
+    writer.ue(119).ue(67).u(1, 1).u(1, 1)
+    writer.u(1, 1).ue(0).ue(0).ue(0).ue(4)
+    writer.u(1, 0)
+    return b"\x67" + writer.to_bytes()
+
+
+def build_hevc_sub_layer_sps():
+    """
+    1920x1080 main profile sps with two sub layers carrying their own profile and level
+    """
+    writer = BitWriter().u(4, 0).u(3, 2).u(1, 1)
+    writer.u(2, 0).u(1, 0).u(5, 1).u(32, 0x60000000).u(48, 0x900000000000).u(8, 120)
+    writer.u(1, 1).u(1, 1).u(1, 0).u(1, 1)
+    writer.u(12, 0)
+    writer.u(88, 0).u(8, 90)
+    writer.u(8, 93)
+    writer.ue(0).ue(1).ue(1920).ue(1088)
+    writer.u(1, 1).ue(0).ue(0).ue(0).ue(4)
+    return b"\x42\x01" + writer.to_bytes()
+
+
+def ts_packet(pid, payload, unit_start=False):
+    header = bytes([0x47, (0x40 if unit_start else 0) | (pid >> 8), pid & 0xFF])
+    stuffing = 184 - len(payload)
+    if stuffing <= 0:
+        return header + b"\x10" + payload[:184]
+    adaptation = bytes([stuffing - 1]) + (b"\x00" + b"\xff" * (stuffing - 2) if stuffing > 1 else b"")
+    return header + b"\x30" + adaptation + payload
+
+
+def build_ts(nal, stream_type=0x1B, video_pid=0x100):
+    pat = bytes([0x00, 0xB0, 13, 0, 1, 0xC1, 0, 0, 0, 1, 0xF0, 0x00]) + b"\x00" * 4
+    pmt = bytes([
+        0x02, 0xB0, 18, 0, 1, 0xC1, 0, 0, 0xE0 | (video_pid >> 8), video_pid & 0xFF, 0xF0, 0x00,
+        stream_type, 0xE0 | (video_pid >> 8), video_pid & 0xFF, 0xF0, 0x00,
+    ]) + b"\x00" * 4
+    pes = b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05" + b"\x21\x00\x01\x00\x01"
+    annex_b = b"\x00\x00\x00\x01\x09\xf0" + b"\x00\x00\x00\x01" + nal + b"\x00\x00\x01\x65" + b"\x88" * 200
+    stream = ts_packet(0, b"\x00" + pat, True) + ts_packet(0x1000, b"\x00" + pmt, True)
+    data = pes + annex_b
+    stream += ts_packet(video_pid, data[:184], True)
+    for start in range(184, len(data), 184):
+        stream += ts_packet(video_pid, data[start:start + 184])
+    return stream
+
+
+def build_flv(sps):
+    pps = b"\x68\xeb\xe3\xcb\x22\xc0"
+    record = bytes([1, sps[1], sps[2], sps[3], 0xFF, 0xE1]) + struct.pack(">H", len(sps)) + sps
+    record += b"\x01" + struct.pack(">H", len(pps)) + pps
+    body = b"\x17\x00\x00\x00\x00" + record
+    tag = bytes([9]) + len(body).to_bytes(3, "big") + b"\x00" * 7 + body
+    return b"FLV\x01\x01\x00\x00\x00\x09" + b"\x00" * 4 + tag + struct.pack(">I", len(tag))
+
+
+def test_h264_sps():
+    assert parse_h264_sps(X264_SPS) == (1920, 1080)
+    assert parse_h264_sps(build_h264_scaling_sps()) == (1920, 1080)
+
+
+def test_hevc_sps():
+    assert parse_hevc_sps(X265_SPS) == (1920, 1080)
+    assert parse_hevc_sps(build_hevc_sub_layer_sps()) == (1920, 1080)
+
+
+def test_truncated_sps_returns_none():
+    for nal, hevc in (
+            (X264_SPS, False),
+            (build_h264_scaling_sps(), False),
+            (X265_SPS, True),
+            (build_hevc_sub_layer_sps(), True),
+    ):
+        assert get_size_from_nal_units(b"\x00\x00\x01" + nal[:len(nal) // 3], hevc) is None
+        # the size is complete before the vui, so a longer prefix may still be parsed but never to another size
+        sizes = {get_size_from_nal_units(b"\x00\x00\x01" + nal[:length], hevc) for length in range(len(nal))}
+        assert sizes <= {None, (1920, 1080)}
+
+
+def test_ts_video_size():
+    assert get_ts_video_size(build_ts(X264_SPS)) == (1920, 1080)
+    assert get_ts_video_size(build_ts(X265_SPS, stream_type=0x24)) == (1920, 1080)
+    assert get_resolution_from_bytes(build_ts(build_h264_scaling_sps())) == "1920x1080"
+
+
+def test_truncated_ts_returns_none():
+    data = build_ts(X264_SPS)
+    assert get_resolution_from_bytes(data[:188]) is None
+    assert get_resolution_from_bytes(data[:2 * 188]) is None
+    assert get_resolution_from_bytes(data[:2 * 188 + 40]) is None
+
+
+def test_flv_video_size():
+    assert get_flv_video_size(build_flv(X264_SPS)) == (1920, 1080)
+    assert get_resolution_from_bytes(build_flv(build_h264_scaling_sps())) == "1920x1080"
+
+
+def test_truncated_flv_returns_none():
+    data = build_flv(X264_SPS)
+    for length in (3, 13, 13 + 11, 13 + 11 + 5 + 8 + 6):
+        assert get_resolution_from_bytes(data[:length]) is None
@@ -1,11 +1,12 @@
 import asyncio
-import copy
 from collections import defaultdict
+from functools import partial
 from logging import INFO
 from typing import Any, Dict, Optional, Set, Tuple
 
 import utils.constants as constants
-from utils.channel import sort_channel_result, generate_channel_statistic, write_channel_to_file, retain_origin
+from utils.channel import (sort_channel_result, generate_channel_statistic, write_channel_to_file, retain_origin,
+                           ResultWriter)
 from utils.config import config
 from utils.tools import get_logger
 
@@ -28,12 +29,18 @@ class ResultAggregator:
             result: Optional[Dict[str, Dict[str, list]]] = None,
     ):
         self.base_data = base_data
-        self.result = sort_channel_result(
+        sorted_result = sort_channel_result(
             base_data,
             result=result,
             ipv6_support=ipv6_support
         )
+        self.result: Dict[str, Dict[str, list]] = defaultdict(lambda: defaultdict(list))
+        for cate, names in base_data.items():
+            for name in names.keys():
+                self.result[cate][name] = list(sorted_result.get(cate, {}).get(name, []))
         self.test_results: Dict[str, Dict[str, list]] = defaultdict(lambda: defaultdict(list))
+        self._versions: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._snapshots: Dict[Tuple[str, str], Tuple[int, Tuple[dict, ...]]] = {}
         self._dirty = False
         self._dirty_count = 0
         self._stopped = True
@@ -42,10 +49,12 @@ class ResultAggregator:
         self.write_interval = write_interval
         self.first_channel_name = first_channel_name
         self.ipv6_support = ipv6_support
+        self.writer = ResultWriter(ipv6=ipv6_support, first_channel_name=first_channel_name)
         self.sort_logger = sort_logger or get_logger(constants.result_log_path, level=INFO, init=True)
         self.stat_logger = stat_logger or get_logger(constants.statistic_log_path, level=INFO, init=True)
         self.is_last = False
         self._lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
         self._min_items_before_flush = min_items_before_flush
         self.flush_debounce = flush_debounce if flush_debounce is not None else max(0.2, write_interval / 2)
         self._flush_event = asyncio.Event()
@@ -78,6 +87,7 @@ class ResultAggregator:
         Add a test result item for a specific category and name.
         """
         self.test_results[cate][name].append(item)
+        self._versions[(cate, name)] += 1
         self._dirty = True
         self._dirty_count += 1
         self.is_last = is_last
@@ -109,6 +119,19 @@ class ResultAggregator:
                 except Exception:
                     pass
 
+    def _get_snapshot(self, cate: str, name: str) -> Tuple[dict, ...]:
+        """
+        Get the immutable snapshot of the channel test results, only the items added since the last snapshot are copied
+        """
+        key = (cate, name)
+        version = self._versions.get(key, 0)
+        snapshot_version, snapshot = self._snapshots.get(key, (0, ()))
+        if snapshot_version != version:
+            items = self.test_results[cate][name]
+            snapshot = snapshot + tuple(dict(item) for item in items[len(snapshot):])
+            self._snapshots[key] = (version, snapshot)
+        return snapshot
+
     async def _atomic_write_sorted_view(
             self,
             test_copy: Dict[str, Dict[str, list]],
@@ -171,32 +194,28 @@ class ResultAggregator:
             except Exception:
                 new_sorted = defaultdict(lambda: defaultdict(list))
 
-        merged = defaultdict(lambda: defaultdict(list))
-
-        for cate, names in self.base_data.items():
-            for name in names.keys():
-                merged[cate][name] = list(self.result.get(cate, {}).get(name, []))
-
         for cate, names in new_sorted.items():
             if cate not in self.base_data:
                 continue
             for name, vals in names.items():
                 if name in self.base_data.get(cate, {}) and vals:
-                    merged[cate][name] = list(vals)
+                    self.result[cate][name] = list(vals)
 
         loop = asyncio.get_running_loop()
         await loop.run_in_executor(
             None,
-            write_channel_to_file,
-            merged,
-            self.ipv6_support,
-            self.first_channel_name,
-            True,
-            self.is_last,
+            partial(
+                write_channel_to_file,
+                self.result,
+                self.ipv6_support,
+                self.first_channel_name,
+                True,
+                self.is_last,
+                writer=self.writer,
+                affected=affected,
+            )
         )
 
-        self.result = merged
-
     async def _debounce_loop(self):
         """
         Debounce loop to handle flush events.
@@ -223,8 +242,11 @@ class ResultAggregator:
         async with self._lock:
             if not self._dirty and not force:
                 return
-            test_copy = copy.deepcopy(self.test_results)
             pending = set(self._pending_channels)
+            channels = set(self._versions) if force else pending
+            test_copy: Dict[str, Dict[str, list]] = defaultdict(dict)
+            for cate, name in channels:
+                test_copy[cate][name] = list(self._get_snapshot(cate, name))
             self._pending_channels.clear()
 
             if force:
@@ -239,7 +261,8 @@ class ResultAggregator:
 
         affected = None if force else (pending if pending else None)
         try:
-            await self._atomic_write_sorted_view(test_copy, affected=affected, finished=finished_for_flush)
+            async with self._write_lock:
+                await self._atomic_write_sorted_view(test_copy, affected=affected, finished=finished_for_flush)
         except Exception:
             pass
 
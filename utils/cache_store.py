@@ -0,0 +1,235 @@
+import gzip
+import os
+import pickle
+import struct
+import threading
+import zlib
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional, Tuple
+
+from utils.tools import to_serializable
+
+MAGIC = b"IPTVCACHE\x01"
+RECORD_HEADER = struct.Struct(">HI")
+_ENCODING = "utf-8"
+
+
+def _encode_key(cate: str, name: str) -> bytes:
+    return f"{cate}\x00{name}".encode(_ENCODING)
+
+
+def _decode_key(data: bytes) -> Tuple[str, str]:
+    cate, _, name = data.decode(_ENCODING).partition("\x00")
+    return cate, name
+
+
+class ChannelCache:
+    """
+    Read access of the channel result cache, the file is a sequence of records
+    (key length, data length, cate and name, zlib compressed pickle of the channel info list),
+    only the keys are read when opened and each channel is decoded once on first access
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self._decoded: Dict[Tuple[str, str], list] = {}
+        self.signature = None
+
+    @classmethod
+    def open(cls, path: str) -> "ChannelCache":
+        cache = cls(path)
+        stat = os.stat(path)
+        cache.signature = (stat.st_mtime_ns, stat.st_size)
+        f = open(path, "rb")
+        try:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("invalid cache file")
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                key_length, data_length = RECORD_HEADER.unpack(header)
+                cate, name = _decode_key(f.read(key_length))
+                cache._index.setdefault(cate, {})[name] = (f.tell(), data_length)
+                f.seek(data_length, os.SEEK_CUR)
+        except Exception:
+            f.close()
+            raise
+        cache._file = f
+        return cache
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChannelCache":
+        """
+        Wrap an already loaded result tree, used for the legacy pickle cache
+        """
+        cache = cls()
+        for cate, channels in (data or {}).items():
+            for name, info_list in channels.items():
+                cache._index.setdefault(cate, {})[name] = (0, 0)
+                cache._decoded[(cate, name)] = info_list
+        return cache
+
+    def get_channel(self, cate: str, name: str) -> Optional[list]:
+        """
+        Get the info list of the channel, None if it is not cached
+        """
+        key = (cate, name)
+        info_list = self._decoded.get(key)
+        if info_list is not None:
+            return info_list
+        location = self._index.get(cate, {}).get(name)
+        if location is None or self._file is None:
+            return None
+        with self._lock:
+            info_list = self._decoded.get(key)
+            if info_list is None:
+                offset, length = location
+                self._file.seek(offset)
+                info_list = pickle.loads(zlib.decompress(self._file.read(length)))
+                self._decoded[key] = info_list
+        return info_list
+
+    def iter_channels(self) -> Iterator[Tuple[str, str, list]]:
+        for cate, names in self._index.items():
+            for name in names:
+                info_list = self.get_channel(cate, name)
+                if info_list is not None:
+                    yield cate, name, info_list
+
+    def __len__(self) -> int:
+        return sum(len(names) for names in self._index.values())
+
+    def as_result(self) -> "CacheView":
+        return CacheView(self)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._decoded.clear()
+            self._index.clear()
+
+
+class CategoryView(Mapping):
+    """
+    Read only name -> info list mapping of a category, the channels are decoded on access
+    """
+
+    def __init__(self, cache: ChannelCache, cate: str):
+        self._cache = cache
+        self._cate = cate
+
+    def __getitem__(self, name: str) -> list:
+        info_list = self._cache.get_channel(self._cate, name)
+        if info_list is None:
+            raise KeyError(name)
+        return info_list
+
+    def __contains__(self, name) -> bool:
+        return name in self._cache._index.get(self._cate, {})
+
+    def __iter__(self):
+        return iter(self._cache._index.get(self._cate, {}))
+
+    def __len__(self) -> int:
+        return len(self._cache._index.get(self._cate, {}))
+
+
+class CacheView(Mapping):
+    """
+    Read only cate -> name -> info list mapping of the cache, a drop-in replacement of the loaded result tree
+    """
+
+    def __init__(self, cache: ChannelCache):
+        self._cache = cache
+
+    def __getitem__(self, cate: str) -> CategoryView:
+        if cate not in self._cache._index:
+            raise KeyError(cate)
+        return CategoryView(self._cache, cate)
+
+    def __contains__(self, cate) -> bool:
+        return cate in self._cache._index
+
+    def __iter__(self):
+        return iter(self._cache._index)
+
+    def __len__(self) -> int:
+        return len(self._cache._index)
+
+
+_cache: Optional[ChannelCache] = None
+_cache_lock = threading.Lock()
+
+
+def _load_legacy(path: str) -> ChannelCache:
+    with gzip.open(path, "rb") as f:
+        return ChannelCache.from_dict(pickle.load(f) or {})
+
+
+def get_cache(path: str, legacy_path: Optional[str] = None) -> ChannelCache:
+    """
+    Get the shared cache of the file, it is opened once and reopened only when the file changed,
+    the legacy gzip pickle cache is read when the new cache does not exist yet
+    """
+    global _cache
+    with _cache_lock:
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if _cache is not None and _cache.signature == signature and _cache.path in (path, legacy_path):
+            return _cache
+        if _cache is not None:
+            _cache.close()
+        if signature:
+            _cache = ChannelCache.open(path)
+        elif legacy_path and os.path.exists(legacy_path):
+            _cache = _load_legacy(legacy_path)
+            _cache.path = legacy_path
+        else:
+            _cache = ChannelCache(path)
+        return _cache
+
+
+def close_cache() -> None:
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+
+def save_cache(path: str, result: dict, legacy_path: Optional[str] = None) -> None:
+    """
+    Write the result tree to the cache one channel record at a time and replace the file atomically
+    """
+    dir_path = os.path.dirname(path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    close_cache()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        for cate, channels in (result or {}).items():
+            for name, info_list in channels.items():
+                key = _encode_key(cate, name)
+                data = zlib.compress(pickle.dumps(to_serializable(info_list), pickle.HIGHEST_PROTOCOL))
+                f.write(RECORD_HEADER.pack(len(key), len(data)))
+                f.write(key)
+                f.write(data)
+    os.replace(tmp_path, path)
+    if legacy_path and os.path.exists(legacy_path):
+        try:
+            os.remove(legacy_path)
+        except OSError:
+            pass
+
+
+__all__ = ["ChannelCache", "CacheView", "get_cache", "close_cache", "save_cache"]
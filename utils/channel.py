@@ -1,24 +1,32 @@
 import asyncio
-import gzip
 import json
 import math
 from bs4 import NavigableString
 import os
-import pickle
 import re
 import tempfile
 from collections import defaultdict
 from logging import INFO
+from time import time
 
 import utils.constants as constants
+import utils.probe_store as probe_store
 from utils.alias import Alias
+from utils.cache_store import get_cache
 from utils.config import config
 from utils.db import get_db_connection, return_db_connection
 from utils.frozen import is_url_frozen, mark_url_bad, mark_url_good
 from utils.i18n import t
 from utils.ip_checker import IPChecker
+from utils.limiter import AdaptiveLimiter
+from utils.process_pool import media_pool
+from utils.requests.tools import headers as request_headers
 from utils.speed import (
+    SessionManager,
     get_speed,
+    get_fanout_result,
+    get_first_byte_delay,
+    log_speed_result,
     get_speed_result,
     get_sort_result,
     check_ffmpeg_installed_status
@@ -34,8 +42,11 @@ from utils.tools import (
     get_logger,
     get_datetime_now,
     get_url_host,
+    get_url_template,
     check_ipv_type_match,
-    convert_to_m3u,
+    get_m3u_entry,
+    get_m3u_header,
+    get_logo_url,
     custom_print,
     get_name_uri_from_dir,
     get_resolution_value,
@@ -204,46 +215,44 @@ def get_channel_items(whitelist_maps, blacklist) -> CategoryChannelData:
             )
 
     if config.open_history:
-        if os.path.exists(constants.cache_path):
-            try:
-                with gzip.open(constants.cache_path, "rb") as file:
-                    old_result = pickle.load(file)
-                    for cate, data in channels.items():
-                        if cate in old_result:
-                            for name, info_list in data.items():
-                                urls = [
-                                    url
-                                    for item in info_list
-                                    if (url := item["url"])
-                                ]
-                                if name in old_result[cate]:
-                                    channel_data = channels[cate][name]
-                                    for info in old_result[cate][name]:
-                                        if info:
-                                            info_url = info["url"]
-                                            try:
-                                                if info["origin"] in retain_origin or check_url_by_keywords(info_url,
-                                                                                                            blacklist):
-                                                    continue
-                                                if check_channel_need_frozen(info):
-                                                    mark_url_bad(info_url, initial=True)
-                                                    continue
-                                            except:
-                                                pass
-                                            if info_url not in urls:
-                                                channel_data.append(info)
-
-                                    if not channel_data:
-                                        for info in old_result[cate][name]:
-                                            old_result_url = info["url"]
-                                            if info and info[
-                                                "origin"] not in retain_origin and old_result_url not in urls and not check_url_by_keywords(
-                                                old_result_url, blacklist):
-                                                channel_data.append(info)
-
-            except Exception as e:
-                print(t("msg.error_load_cache").format(info=e))
-                pass
+        try:
+            old_result = get_cache(constants.cache_path, constants.legacy_cache_path).as_result()
+            for cate, data in channels.items():
+                if cate in old_result:
+                    for name, info_list in data.items():
+                        urls = [
+                            url
+                            for item in info_list
+                            if (url := item["url"])
+                        ]
+                        if name in old_result[cate]:
+                            channel_data = channels[cate][name]
+                            for info in old_result[cate][name]:
+                                if info:
+                                    info_url = info["url"]
+                                    try:
+                                        if info["origin"] in retain_origin or check_url_by_keywords(info_url,
+                                                                                                    blacklist):
+                                            continue
+                                        if check_channel_need_frozen(info):
+                                            mark_url_bad(info_url, initial=True)
+                                            continue
+                                    except:
+                                        pass
+                                    if info_url not in urls:
+                                        channel_data.append(dict(info))
+
+                            if not channel_data:
+                                for info in old_result[cate][name]:
+                                    old_result_url = info["url"]
+                                    if info and info[
+                                        "origin"] not in retain_origin and old_result_url not in urls and not check_url_by_keywords(
+                                        old_result_url, blacklist):
+                                        channel_data.append(dict(info))
+
+        except Exception as e:
+            print(t("msg.error_load_cache").format(info=e))
+            pass
     return channels
 
 
@@ -525,6 +534,63 @@ def is_valid_speed_result(info) -> bool:
         return False
 
 
+def get_speed_test_cluster_key(info: ChannelData) -> tuple[str, str] | None:
+    """
+    Get the speed test cluster key of the channel data, urls of the same channel with the same host
+    and path template are expected to share the speed test result
+    """
+    if not info.get("host"):
+        return None
+    return info.get("name"), get_url_template(info["url"])
+
+
+async def get_triage_result(data, open_headers=False, ipv6_proxy=None) -> dict[str, int | None]:
+    """
+    Get the connect and first byte delay of the urls in the channel data,
+    None means the url can not be triaged by http and should be tested directly
+    """
+    semaphore = asyncio.Semaphore(config.speed_test_triage_limit)
+    triage_result = {}
+
+    async def limited_get_first_byte_delay(info):
+        url = info["url"]
+        if (info.get("ipv_type") == "ipv6" and ipv6_proxy) or constants.rt_url_pattern.match(url):
+            triage_result[url] = None
+            return
+        async with semaphore:
+            headers = {**request_headers, **((open_headers and info.get("headers")) or {})}
+            triage_result[url] = await get_first_byte_delay(url, headers)
+
+    tasks = [
+        limited_get_first_byte_delay(info)
+        for channel_obj in data.values()
+        for info_list in channel_obj.values()
+        for info in info_list
+    ]
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return triage_result
+
+
+def get_triage_schedule(info_list: list[ChannelData], triage_result: dict[str, int | None],
+                        limit: int = 0) -> tuple[list[ChannelData], list[ChannelData], list[ChannelData]]:
+    """
+    Split the channel urls into the scheduled urls ranked by first byte delay, the unreachable urls
+    and the skipped urls beyond the limit
+    """
+    reachable, unreachable = [], []
+    for info in info_list:
+        delay = triage_result.get(info["url"])
+        if delay == -1:
+            unreachable.append(info)
+        else:
+            reachable.append(info)
+    reachable.sort(key=lambda item: (triage_result.get(item["url"]) is None, triage_result.get(item["url"]) or 0))
+    if limit > 0:
+        return reachable[:limit], unreachable, reachable[limit:]
+    return reachable, unreachable, []
+
+
 async def test_speed(data, ipv6=False, callback=None, on_task_complete=None):
     """
     Test speed of channel data
@@ -533,19 +599,40 @@ async def test_speed(data, ipv6=False, callback=None, on_task_complete=None):
     open_headers = config.open_headers
     open_full_speed_test = config.open_full_speed_test
     get_resolution = config.open_filter_resolution and check_ffmpeg_installed_status()
-    semaphore = asyncio.Semaphore(config.speed_test_limit)
     logger = get_logger(constants.speed_test_log_path, level=INFO, init=True)
+    limiter = AdaptiveLimiter(logger=logger)
+    media_pool.reset_stats()
 
     async def limited_get_speed(channel_info):
-        async with semaphore:
+        async with limiter:
             headers = (open_headers and channel_info.get("headers")) or None
-            return await get_speed(
+            start_time = time()
+            result = await get_speed(
                 channel_info,
                 headers=headers,
                 ipv6_proxy=ipv6_proxy_url,
                 filter_resolution=get_resolution,
                 logger=logger,
             )
+            limiter.record(result, time() - start_time)
+            return result
+
+    async def fanout_get_speed(channel_info, sample_tasks):
+        await asyncio.wait(sample_tasks)
+        samples = [
+            task.result() for task in sample_tasks
+            if not task.cancelled() and task.exception() is None and task.result()
+        ]
+        result = get_fanout_result(samples, channel_info.get("resolution"))
+        if result is None:
+            return await limited_get_speed(channel_info)
+        log_speed_result(logger, channel_info, result)
+        return result
+
+    async def triaged_get_speed(channel_info, result):
+        if result:
+            log_speed_result(logger, channel_info, result)
+        return result
 
     total_tasks = sum(len(info_list) for channel_obj in data.values() for info_list in channel_obj.values())
     total_tasks_by_channel = defaultdict(int)
@@ -559,6 +646,8 @@ async def test_speed(data, ipv6=False, callback=None, on_task_complete=None):
     completed_by_channel = defaultdict(int)
     urls_limit = config.urls_limit
     valid_count_by_channel = defaultdict(int)
+    # urls only found unreachable by the triage, they are not tested so they are neither frozen nor thawed
+    triage_unreachable_urls = set()
 
     def _cancel_remaining_channel_tasks(cate, name):
         for task, meta in list(channel_map.items()):
@@ -596,10 +685,11 @@ async def test_speed(data, ipv6=False, callback=None, on_task_complete=None):
         merged = {**info, **result}
         grouped_results[cate][name].append(merged)
 
-        if check_channel_need_frozen(merged):
-            mark_url_bad(merged.get("url"))
-        else:
-            mark_url_good(merged.get("url"))
+        if result and merged.get("url") not in triage_unreachable_urls:
+            if check_channel_need_frozen(merged):
+                mark_url_bad(merged.get("url"))
+            else:
+                mark_url_good(merged.get("url"))
 
         if is_valid_speed_result(merged):
             valid_count_by_channel[(cate, name)] += 1
@@ -624,18 +714,91 @@ async def test_speed(data, ipv6=False, callback=None, on_task_complete=None):
             except Exception:
                 pass
 
-    for cate, channel_obj in data.items():
-        for name, info_list in channel_obj.items():
-            for info in info_list:
-                info['name'] = name
-                task = asyncio.create_task(limited_get_speed(info))
-                channel_map[task] = (cate, name, info)
-                task.add_done_callback(_on_task_done)
-                tasks.append(task)
+    def _add_task(cate, name, info, coro):
+        task = asyncio.create_task(coro)
+        channel_map[task] = (cate, name, info)
+        task.add_done_callback(_on_task_done)
+        tasks.append(task)
+        return task
+
+    cluster_sample = config.speed_test_cluster_sample
+    cluster_tasks = defaultdict(list)
+    fanned = 0
+    open_triage = config.open_speed_test_triage
+    triage_limit = 0 if open_full_speed_test else urls_limit * config.speed_test_triage_multiple
+    try:
+        async with SessionManager() as session_manager:
+            await limiter.start(lambda: session_manager.received)
+            triage_result = None
+            if open_triage:
+                triage_start_time = time()
+                triage_result = await get_triage_result(data, open_headers, ipv6_proxy_url)
+                triage_stats = defaultdict(int)
+            for cate, channel_obj in data.items():
+                for name, info_list in channel_obj.items():
+                    for info in info_list:
+                        info['name'] = name
+                    if triage_result is not None:
+                        scheduled, unreachable, skipped = get_triage_schedule(info_list, triage_result, triage_limit)
+                        triage_stats["scheduled"] += len(scheduled)
+                        triage_stats["unreachable"] += len(unreachable)
+                        triage_stats["skipped"] += len(skipped)
+                    else:
+                        scheduled, unreachable, skipped = info_list, [], []
+                    for info in unreachable:
+                        triage_unreachable_urls.add(info["url"])
+                        _add_task(cate, name, info, triaged_get_speed(
+                            info, {'speed': 0, 'delay': -1, 'resolution': info.get('resolution')}))
+                    for info in skipped:
+                        _add_task(cate, name, info, triaged_get_speed(info, {}))
+                    for info in scheduled:
+                        cluster_key = get_speed_test_cluster_key(info) if cluster_sample > 0 else None
+                        sample_tasks = cluster_tasks[cluster_key] if cluster_key else None
+                        if sample_tasks is not None and len(sample_tasks) >= cluster_sample:
+                            _add_task(cate, name, info, fanout_get_speed(info, list(sample_tasks)))
+                            fanned += 1
+                        else:
+                            task = _add_task(cate, name, info, limited_get_speed(info))
+                            if sample_tasks is not None:
+                                sample_tasks.append(task)
+            if triage_result is not None:
+                triage_content = t("msg.speed_test_triage_stats").format(
+                    total=len(triage_result), time=f"{time() - triage_start_time:.1f}", **triage_stats
+                )
+                logger.info(triage_content)
+                print(triage_content)
 
-    if tasks:
-        await asyncio.gather(*tasks, return_exceptions=True)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await limiter.stop()
 
+    if cluster_tasks:
+        cluster_content = t("msg.speed_test_cluster_stats").format(
+            clusters=len(cluster_tasks), probed=sum(len(items) for items in cluster_tasks.values()), fanned=fanned
+        )
+        logger.info(cluster_content)
+        print(cluster_content)
+    if probe_store.is_enabled():
+        probe_store_content = t("msg.speed_test_probe_store_stats").format(**probe_store.get_stats())
+        logger.info(probe_store_content)
+        print(probe_store_content)
+    if probe_store.is_resolution_enabled() and get_resolution:
+        resolution_content = t("msg.speed_test_resolution_cache_stats").format(**probe_store.get_resolution_stats())
+        logger.info(resolution_content)
+        print(resolution_content)
+    if get_resolution:
+        media_content = t("msg.speed_test_media_process_stats").format(**media_pool.get_stats())
+        logger.info(media_content)
+        print(media_content)
+    stats_content = t("msg.speed_test_connection_stats").format(**session_manager.get_stats())
+    logger.info(stats_content)
+    print(stats_content)
+    hls_stats = session_manager.get_hls_stats()
+    if hls_stats["playlists"]:
+        hls_content = t("msg.speed_test_hls_stats").format(**hls_stats)
+        logger.info(hls_content)
+        print(hls_content)
     logger.handlers.clear()
     return grouped_results
 
@@ -712,102 +875,10 @@ def generate_channel_statistic(logger, cate, name, values):
         print(content)
 
 
-def process_write_content(
-        path: str,
-        data: CategoryChannelData,
-        hls_url: str = None,
-        open_empty_category: bool = False,
-        ipv_type_prefer: list[str] = None,
-        origin_type_prefer: list[str] = None,
-        first_channel_name: str = None,
-        enable_log: bool = False,
-        is_last: bool = False,
-):
+def write_file_atomic(path: str, content: str) -> bool:
+    """
+    Write the content into the file with a single buffered write through a temp file
     """
-    Get channel write content
-    :param path: write into path
-    :param data: channel data
-    :param hls_url: hls url
-    :param open_empty_category: show empty category
-    :param ipv_type_prefer: ipv type prefer
-    :param origin_type_prefer: origin type prefer
-    :param first_channel_name: the first channel name
-    :param enable_log: enable log
-    :param is_last: is last write
-    """
-    content = ""
-    no_result_name = []
-    first_cate = True
-    result_data = defaultdict(list)
-    custom_print.disable = not enable_log
-    rtmp_type = ["hls"] if hls_url else []
-    open_url_info = config.open_url_info
-    for cate, channel_obj in data.items():
-        content += f"{'\n\n' if not first_cate else ''}{cate},#genre#"
-        first_cate = False
-        channel_obj_keys = channel_obj.keys()
-        for i, name in enumerate(channel_obj_keys):
-            info_list = data.get(cate, {}).get(name, [])
-            channel_urls = get_total_urls(info_list, ipv_type_prefer, origin_type_prefer, rtmp_type)
-            result_data[name].extend(channel_urls)
-            if not channel_urls:
-                if open_empty_category:
-                    no_result_name.append(name)
-                continue
-            for item in channel_urls:
-                item_url = item["url"]
-                if open_url_info and item["extra_info"]:
-                    item_url = add_url_info(item_url, item["extra_info"])
-                total_item_url = f"{hls_url}/{item['id']}.m3u8" if hls_url else item_url
-                content += f"\n{name},{total_item_url}"
-    if open_empty_category and no_result_name and is_last:
-        custom_print(f"\n{t("msg.no_result_channel")}")
-        content += f"\n\n{t("content.no_result_channel")},#genre#"
-        for i, name in enumerate(no_result_name):
-            end_char = ", " if i < len(no_result_name) - 1 else ""
-            custom_print(name, end=end_char)
-            content += f"\n{name},url"
-    if config.open_update_time:
-        update_time_item = next(
-            (urls[0] for channel_obj in data.values()
-             for info_list in channel_obj.values()
-             if (urls := get_total_urls(info_list, ipv_type_prefer, origin_type_prefer, rtmp_type))),
-            {"id": "id", "url": "url"}
-        )
-        now = get_datetime_now()
-        update_time_item_url = update_time_item["url"]
-        update_title = t("content.update_time") if is_last else t("content.update_running")
-        if open_url_info and update_time_item["extra_info"]:
-            update_time_item_url = add_url_info(update_time_item_url, update_time_item["extra_info"])
-        value = f"{hls_url}/{update_time_item["id"]}.m3u8" if hls_url else update_time_item_url
-        if config.update_time_position == "top":
-            content = f"{update_title},#genre#\n{now},{value}\n\n{content}"
-        else:
-            content += f"\n\n{update_title},#genre#\n{now},{value}"
-    if hls_url:
-        db_dir = os.path.dirname(constants.rtmp_data_path)
-        if db_dir:
-            os.makedirs(db_dir, exist_ok=True)
-
-        try:
-            conn = get_db_connection(constants.rtmp_data_path)
-        except Exception as e:
-            print(t("msg.write_error").format(info=f"open rtmp db error: {e}"))
-        else:
-            try:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "CREATE TABLE IF NOT EXISTS result_data (id TEXT PRIMARY KEY, url TEXT, headers TEXT)"
-                )
-                for data_list in result_data.values():
-                    for item in data_list:
-                        cursor.execute(
-                            "INSERT OR REPLACE INTO result_data (id, url, headers) VALUES (?, ?, ?)",
-                            (item["id"], item["url"], json.dumps(item.get("headers", None)))
-                        )
-                conn.commit()
-            finally:
-                return_db_connection(constants.rtmp_data_path, conn)
     try:
         target_dir = os.path.dirname(path) or "."
         os.makedirs(target_dir, exist_ok=True)
@@ -827,60 +898,187 @@ def process_write_content(
                 f.write(content)
         except Exception as e2:
             print(t("msg.write_error").format(info=e2))
-            return
-    try:
-        convert_to_m3u(path, first_channel_name, data=result_data)
-    except Exception:
-        pass
+            return False
+    return True
 
 
-def write_channel_to_file(data, ipv6=False, first_channel_name=None, skip_print=False, is_last=False):
+def save_hls_result_data(items: list[ChannelData]) -> None:
     """
-    Write channel to file
+    Bulk upsert the hls result data into the rtmp db in a single transaction
     """
+    db_dir = os.path.dirname(constants.rtmp_data_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
     try:
-        if not skip_print:
-            print(t("msg.writing_result"))
-        open_empty_category = config.open_empty_category
-        ipv_type_prefer = list(config.ipv_type_prefer)
+        conn = get_db_connection(constants.rtmp_data_path)
+    except Exception as e:
+        print(t("msg.write_error").format(info=f"open rtmp db error: {e}"))
+        return
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS result_data (id TEXT PRIMARY KEY, url TEXT, headers TEXT)"
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO result_data (id, url, headers) VALUES (?, ?, ?)",
+                [(item["id"], item["url"], json.dumps(item.get("headers", None))) for item in items]
+            )
+    except Exception as e:
+        print(t("msg.write_error").format(info=f"save rtmp db error: {e}"))
+    finally:
+        return_db_connection(constants.rtmp_data_path, conn)
+
+
+class ResultWriter:
+    """
+    Incremental single pass result writer, the url selection of every channel is computed once per ipv type prefer
+    and rendered into the txt and m3u fragments of all output variants, only the affected channels are re-rendered
+    """
+
+    def __init__(self, ipv6: bool = False, first_channel_name: str = None):
+        self.ipv6 = ipv6
+        self.first_channel_name = first_channel_name
+        self.hls_url = None
+        self.logo_url = None
+        self._renders: dict[tuple[str, str], dict[tuple[str, ...], dict]] = {}
+
+    def get_file_list(self) -> list[dict]:
+        """
+        Get the output files with their write options
+        """
+        ipv_type_prefer = tuple(config.ipv_type_prefer)
         if any(pref == "auto" for pref in ipv_type_prefer):
-            ipv_type_prefer = ["ipv6", "ipv4"] if ipv6 else ["ipv4", "ipv6"]
-        origin_type_prefer = config.origin_type_prefer
-        hls_url = f"{get_public_url()}/hls"
+            ipv_type_prefer = ("ipv6", "ipv4") if self.ipv6 else ("ipv4", "ipv6")
         file_list = [
-            {"path": config.final_file, "enable_log": True},
-            {"path": constants.ipv4_result_path, "ipv_type_prefer": ["ipv4"]},
-            {"path": constants.ipv6_result_path, "ipv_type_prefer": ["ipv6"]}
+            {"path": config.final_file, "enable_log": True, "ipv_type_prefer": ipv_type_prefer},
+            {"path": constants.ipv4_result_path, "ipv_type_prefer": ("ipv4",)},
+            {"path": constants.ipv6_result_path, "ipv_type_prefer": ("ipv6",)}
         ]
         if config.open_rtmp and not os.getenv("GITHUB_ACTIONS"):
             file_list += [
-                {"path": constants.hls_result_path, "hls_url": hls_url},
-                {
-                    "path": constants.hls_ipv4_result_path,
-                    "hls_url": hls_url,
-                    "ipv_type_prefer": ["ipv4"]
-                },
-                {
-                    "path": constants.hls_ipv6_result_path,
-                    "hls_url": hls_url,
-                    "ipv_type_prefer": ["ipv6"]
-                },
+                {"path": constants.hls_result_path, "hls": True, "ipv_type_prefer": ipv_type_prefer},
+                {"path": constants.hls_ipv4_result_path, "hls": True, "ipv_type_prefer": ("ipv4",)},
+                {"path": constants.hls_ipv6_result_path, "hls": True, "ipv_type_prefer": ("ipv6",)},
             ]
+        return file_list
+
+    def render_channel(self, cate: str, name: str, info_list: list[ChannelData], ipv_type_prefer: tuple[str, ...],
+                       hls: bool = False) -> dict:
+        """
+        Render the txt and m3u fragments of the channel for the plain and hls variants
+        """
+        channel_urls = get_total_urls(info_list, list(ipv_type_prefer), config.origin_type_prefer,
+                                      ["hls"] if hls else [])
+        render = {"urls": channel_urls, "txt": [], "m3u": [], "hls_txt": [], "hls_m3u": []}
+        for item in channel_urls:
+            item_url = item["url"]
+            if config.open_url_info and item["extra_info"]:
+                item_url = add_url_info(item_url, item["extra_info"])
+            render["txt"].append(f"\n{name},{item_url}")
+            render["m3u"].append(get_m3u_entry(name, item_url, cate, item, logo_url=self.logo_url))
+            if hls:
+                hls_item_url = f"{self.hls_url}/{item['id']}.m3u8"
+                render["hls_txt"].append(f"\n{name},{hls_item_url}")
+                render["hls_m3u"].append(get_m3u_entry(name, hls_item_url, cate, logo_url=self.logo_url))
+        for key in ("txt", "m3u", "hls_txt", "hls_m3u"):
+            render[key] = "".join(render[key])
+        return render
+
+    def write(self, data: CategoryChannelData, affected: set[tuple[str, str]] = None, is_last: bool = False):
+        """
+        Write the result files, only the affected channels are re-rendered, None means all channels
+        """
+        hls_url = f"{get_public_url()}/hls"
+        logo_url = get_logo_url()
+        if hls_url != self.hls_url or logo_url != self.logo_url:
+            self.hls_url, self.logo_url = hls_url, logo_url
+            self._renders.clear()
+        file_list = self.get_file_list()
+        prefers = list(dict.fromkeys(file["ipv_type_prefer"] for file in file_list))
+        hls = any(file.get("hls") for file in file_list)
+        hls_items = {}
+        for cate, channel_obj in data.items():
+            for name, info_list in channel_obj.items():
+                key = (cate, name)
+                if affected is None or key in affected or key not in self._renders:
+                    renders = {
+                        prefer: self.render_channel(cate, name, info_list or [], prefer, hls)
+                        for prefer in prefers
+                    }
+                    self._renders[key] = renders
+                    if hls:
+                        for render in renders.values():
+                            for item in render["urls"]:
+                                hls_items[item["id"]] = item
         for file in file_list:
-            target_dir = os.path.dirname(file["path"])
-            if target_dir:
-                os.makedirs(target_dir, exist_ok=True)
-            process_write_content(
-                path=file["path"],
-                data=data,
-                hls_url=file.get("hls_url"),
-                open_empty_category=open_empty_category,
-                ipv_type_prefer=file.get("ipv_type_prefer", ipv_type_prefer),
-                origin_type_prefer=origin_type_prefer,
-                first_channel_name=first_channel_name,
-                enable_log=file.get("enable_log", False),
-                is_last=is_last
-            )
+            self.write_file(file, data, is_last)
+        if hls_items:
+            save_hls_result_data(list(hls_items.values()))
+
+    def write_file(self, file: dict, data: CategoryChannelData, is_last: bool = False) -> None:
+        """
+        Splice the channel fragments into the txt and m3u files of the output variant
+        """
+        prefer = file["ipv_type_prefer"]
+        txt_key, m3u_key = ("hls_txt", "hls_m3u") if file.get("hls") else ("txt", "m3u")
+        txt_parts = []
+        m3u_parts = []
+        no_result_name = []
+        update_time_item = None
+        open_empty_category = config.open_empty_category
+        custom_print.disable = not file.get("enable_log", False)
+        for cate, channel_obj in data.items():
+            txt_parts.append(f"{'\n\n' if txt_parts else ''}{cate},#genre#")
+            for name in channel_obj.keys():
+                render = self._renders[(cate, name)][prefer]
+                if not render["urls"]:
+                    if open_empty_category:
+                        no_result_name.append(name)
+                    continue
+                if update_time_item is None:
+                    update_time_item = render["urls"][0]
+                txt_parts.append(render[txt_key])
+                m3u_parts.append(render[m3u_key])
+        if open_empty_category and no_result_name and is_last:
+            no_result_title = t("content.no_result_channel")
+            custom_print(f"\n{t("msg.no_result_channel")}")
+            txt_parts.append(f"\n\n{no_result_title},#genre#")
+            for i, name in enumerate(no_result_name):
+                end_char = ", " if i < len(no_result_name) - 1 else ""
+                custom_print(name, end=end_char)
+                txt_parts.append(f"\n{name},url")
+                m3u_parts.append(get_m3u_entry(name, "url", no_result_title, logo_url=self.logo_url))
+        if config.open_update_time:
+            update_time_item = update_time_item or {"id": "id", "url": "url"}
+            now = get_datetime_now()
+            update_time_item_url = update_time_item["url"]
+            update_title = t("content.update_time") if is_last else t("content.update_running")
+            if config.open_url_info and update_time_item.get("extra_info"):
+                update_time_item_url = add_url_info(update_time_item_url, update_time_item["extra_info"])
+            value = f"{self.hls_url}/{update_time_item["id"]}.m3u8" if file.get("hls") else update_time_item_url
+            update_entry = get_m3u_entry(now, value, update_title, tvg_name=self.first_channel_name,
+                                         logo_url=self.logo_url)
+            if config.update_time_position == "top":
+                txt_parts.insert(0, f"{update_title},#genre#\n{now},{value}\n\n")
+                m3u_parts.insert(0, update_entry)
+            else:
+                txt_parts.append(f"\n\n{update_title},#genre#\n{now},{value}")
+                m3u_parts.append(update_entry)
+        path = file["path"]
+        if write_file_atomic(path, "".join(txt_parts)):
+            write_file_atomic(os.path.splitext(path)[0] + ".m3u", get_m3u_header() + "".join(m3u_parts))
+
+
+def write_channel_to_file(data, ipv6=False, first_channel_name=None, skip_print=False, is_last=False,
+                          writer: ResultWriter = None, affected: set[tuple[str, str]] = None):
+    """
+    Write channel to file
+    """
+    try:
+        if not skip_print:
+            print(t("msg.writing_result"))
+        writer = writer or ResultWriter(ipv6=ipv6, first_channel_name=first_channel_name)
+        writer.write(data, affected=affected, is_last=is_last)
         if not skip_print:
             print(t("msg.write_success"))
     except Exception as e:
@@ -278,6 +278,10 @@ class ConfigManager:
     def app_port(self):
         return self.config.getint("Settings", "app_port", fallback=5180)
 
+    @property
+    def open_async_service(self):
+        return self.config.getboolean("Settings", "open_async_service", fallback=False)
+
     @property
     def nginx_http_port(self):
         return self.config.getint("Settings", "nginx_http_port", fallback=51888)
@@ -330,6 +334,62 @@ class ConfigManager:
     def speed_test_limit(self):
         return self.config.getint("Settings", "speed_test_limit", fallback=5)
 
+    @property
+    def open_adaptive_speed_test_limit(self):
+        return self.config.getboolean("Settings", "open_adaptive_speed_test_limit", fallback=True)
+
+    @property
+    def speed_test_limit_max(self):
+        return self.config.getint("Settings", "speed_test_limit_max", fallback=50)
+
+    @property
+    def speed_test_limit_per_host(self):
+        return self.config.getint("Settings", "speed_test_limit_per_host", fallback=10)
+
+    @property
+    def open_speed_test_triage(self):
+        return self.config.getboolean("Settings", "open_speed_test_triage", fallback=True)
+
+    @property
+    def speed_test_triage_timeout(self):
+        return self.config.getfloat("Settings", "speed_test_triage_timeout", fallback=3)
+
+    @property
+    def speed_test_triage_limit(self):
+        return self.config.getint("Settings", "speed_test_triage_limit", fallback=100)
+
+    @property
+    def speed_test_triage_multiple(self):
+        return self.config.getint("Settings", "speed_test_triage_multiple", fallback=3)
+
+    @property
+    def speed_test_cache_ttl(self):
+        return self.config.getfloat("Settings", "speed_test_cache_ttl", fallback=6)
+
+    @property
+    def speed_test_cluster_sample(self):
+        return self.config.getint("Settings", "speed_test_cluster_sample", fallback=0)
+
+    @property
+    def speed_test_dns_ttl(self):
+        return self.config.getint("Settings", "speed_test_dns_ttl", fallback=300)
+
+    @property
+    def resolution_cache_ttl(self):
+        return self.config.getfloat("Settings", "resolution_cache_ttl", fallback=168)
+
+    @property
+    def media_process_limit(self):
+        return self.config.getint("Settings", "media_process_limit", fallback=0)
+
+    @property
+    def open_speed_test_early_abort(self):
+        return self.config.getboolean("Settings", "open_speed_test_early_abort", fallback=True)
+
+    @property
+    def speed_test_max_size(self):
+        return self.config.getfloat("Settings", "speed_test_max_size", fallback=10)
+
     @property
     def location(self):
         return [
@@ -388,6 +448,14 @@ class ConfigManager:
     def rtmp_max_streams(self):
         return self.config.getint("Settings", "rtmp_max_streams", fallback=10)
 
+    @property
+    def rtmp_prewarm_count(self):
+        return self.config.getint("Settings", "rtmp_prewarm_count", fallback=0)
+
+    @property
+    def rtmp_prewarm_budget(self):
+        return self.config.getfloat("Settings", "rtmp_prewarm_budget", fallback=1)
+
     @property
     def public_scheme(self):
         return self.config.get("Settings", "public_scheme", fallback="http") or "http"
@@ -41,9 +41,15 @@ hls_ipv4_result_path = os.path.join(output_dir, "ipv4/hls.txt")
 
 hls_ipv6_result_path = os.path.join(output_dir, "ipv6/hls.txt")
 
-cache_path = os.path.join(output_dir, "data/cache.gz")
+cache_path = os.path.join(output_dir, "data/cache.dat")
 
-frozen_path = os.path.join(output_dir, "data/frozen.gz")
+legacy_cache_path = os.path.join(output_dir, "data/cache.gz")
+
+frozen_path = os.path.join(output_dir, "data/frozen.db")
+
+legacy_frozen_path = os.path.join(output_dir, "data/frozen.gz")
+
+probe_data_path = os.path.join(output_dir, "data/probe.db")
 
 speed_test_log_path = os.path.join(output_dir, "log/speed_test.log")
 
@@ -62,6 +68,8 @@ url_pattern = re.compile(
 
 rt_url_pattern = re.compile(r"^(rtmp|rtsp)://.*$")
 
+url_number_pattern = re.compile(r"\d+")
+
 demo_txt_pattern = re.compile(r"^(?P<name>[^,，]+)[,，]?(?!#genre#)(?P<value>.+)?$")
 
 txt_pattern = re.compile(r"^(?P<name>[^,，]+)[,，](?!#genre#)(?P<value>.+)$")
@@ -1,18 +1,40 @@
+import asyncio
+import os
 import sqlite3
-from threading import Lock
+from contextlib import contextmanager
+from threading import Lock, Semaphore
+from time import time
 
 
 class SQLitePool:
+    """
+    Connection pool of a sqlite db with a single serialized writer connection and up to pool_size
+    read only connections opened on demand, the checkout wait time and contention are recorded
+    """
+
     def __init__(self, db_path, pool_size=5, timeout=30.0):
         self.db_path = db_path
         self.pool_size = pool_size
         self.pool = []
         self.lock = Lock()
         self.timeout = timeout
-        for _ in range(pool_size):
-            self.pool.append(self._create_connection())
+        self.writer = None
+        self.writer_lock = Lock()
+        self.readers = Semaphore(pool_size)
+        self.stats = {
+            "write": 0, "write_contended": 0, "write_wait": 0.0, "max_write_wait": 0.0,
+            "read": 0, "read_contended": 0, "read_wait": 0.0, "max_read_wait": 0.0,
+        }
 
-    def _create_connection(self):
+    def _create_connection(self, readonly=False):
+        if readonly:
+            uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=self.timeout, check_same_thread=False)
+            try:
+                conn.execute("PRAGMA busy_timeout = 30000;")
+            except Exception:
+                pass
+            return conn
         conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
         try:
             conn.execute("PRAGMA journal_mode=WAL;")
@@ -22,16 +44,58 @@ class SQLitePool:
             pass
         return conn
 
-    def get_connection(self):
+    def _record(self, kind, wait, contended):
         with self.lock:
-            if self.pool:
-                return self.pool.pop()
-            else:
-                return self._create_connection()
+            self.stats[kind] += 1
+            self.stats[f"{kind}_wait"] += wait
+            self.stats[f"max_{kind}_wait"] = max(self.stats[f"max_{kind}_wait"], wait)
+            if contended:
+                self.stats[f"{kind}_contended"] += 1
+
+    def _checkout(self, kind, acquire):
+        start = time()
+        contended = not acquire(blocking=False)
+        if contended:
+            acquire()
+        self._record(kind, time() - start, contended)
+
+    def get_connection(self, readonly=False):
+        """
+        Check out the writer connection, or a read only connection, the writer is held exclusively until returned,
+        None is returned for a read only connection when the db does not exist yet
+        """
+        if readonly:
+            if not os.path.exists(self.db_path):
+                return None
+            self._checkout("read", self.readers.acquire)
+            with self.lock:
+                if self.pool:
+                    return self.pool.pop()
+            try:
+                return self._create_connection(readonly=True)
+            except Exception:
+                self.readers.release()
+                raise
+        self._checkout("write", self.writer_lock.acquire)
+        try:
+            if self.writer is None:
+                self.writer = self._create_connection()
+        except Exception:
+            self.writer_lock.release()
+            raise
+        return self.writer
 
     def return_connection(self, conn):
         if conn is None:
             return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            pass
+        if conn is self.writer:
+            self.writer_lock.release()
+            return
         with self.lock:
             try:
                 if len(self.pool) < self.pool_size:
@@ -43,6 +107,30 @@ class SQLitePool:
                     conn.close()
                 except Exception:
                     pass
+        self.readers.release()
+
+    @contextmanager
+    def connection(self, readonly=False):
+        conn = self.get_connection(readonly)
+        try:
+            yield conn
+        finally:
+            self.return_connection(conn)
+
+    async def run(self, func, *args, readonly=False):
+        """
+        Run func(conn, *args) with a checked out connection in the executor, the event loop never waits on the pool,
+        conn is None for a read only connection when the db does not exist yet
+        """
+        def run_with_connection():
+            with self.connection(readonly) as conn:
+                return func(conn, *args)
+
+        return await asyncio.get_running_loop().run_in_executor(None, run_with_connection)
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
 
     def close_all(self):
         with self.lock:
@@ -52,22 +140,40 @@ class SQLitePool:
                     conn.close()
                 except Exception:
                     pass
+        with self.writer_lock:
+            if self.writer is not None:
+                try:
+                    self.writer.close()
+                except Exception:
+                    pass
+                self.writer = None
 
 
 db_pools = {}
+db_pools_lock = Lock()
 
 
 def get_db_pool(db_path):
     if db_path not in db_pools:
-        db_pools[db_path] = SQLitePool(db_path)
+        with db_pools_lock:
+            if db_path not in db_pools:
+                db_pools[db_path] = SQLitePool(db_path)
     return db_pools[db_path]
 
 
-def get_db_connection(db_path):
+def get_db_connection(db_path, readonly=False):
     pool = get_db_pool(db_path)
-    return pool.get_connection()
+    return pool.get_connection(readonly)
 
 
 def return_db_connection(db_path, conn):
     pool = get_db_pool(db_path)
     pool.return_connection(conn)
+
+
+async def run_db(db_path, func, *args, readonly=False):
+    return await get_db_pool(db_path).run(func, *args, readonly=readonly)
+
+
+def get_db_stats():
+    return {db_path: pool.get_stats() for db_path, pool in list(db_pools.items())}
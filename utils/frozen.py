@@ -1,19 +1,80 @@
 import gzip
+import heapq
 import os
 import pickle
 import time
-from typing import Dict, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.db import get_db_connection, return_db_connection
 
 MAX_BACKOFF = 24 * 3600
 BASE_BACKOFF = 60
 
 _frozen: Dict[str, Dict] = {}
+# (frozen_until, url), entries whose frozen_until no longer matches the meta are stale and skipped
+_heap: List[Tuple[int, str]] = []
+_frozen_urls: Set[str] = set()
+_changed: Set[str] = set()
+_removed: Set[str] = set()
 
 
 def _now_ts() -> int:
     return int(time.time())
 
 
+def _ensure_table(conn) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS frozen_url ("
+        "url TEXT PRIMARY KEY, bad_count INTEGER, last_bad INTEGER, last_good INTEGER, frozen_until INTEGER)"
+    )
+
+
+def _touch(url: str) -> None:
+    _changed.add(url)
+    _removed.discard(url)
+
+
+def _remove(url: str) -> None:
+    _frozen.pop(url, None)
+    _frozen_urls.discard(url)
+    _changed.discard(url)
+    _removed.add(url)
+
+
+def _thaw(url: str, meta: Dict) -> None:
+    """
+    Release the url whose backoff expired, the bad count decays by one on every release
+    """
+    meta["frozen_until"] = None
+    meta["bad_count"] = max(0, meta.get("bad_count", 0) - 1)
+    _frozen_urls.discard(url)
+    if meta["bad_count"] == 0:
+        _remove(url)
+    else:
+        _touch(url)
+
+
+def _expire(now: int) -> None:
+    """
+    Release all the urls whose backoff expired by popping the heap up to now
+    """
+    while _heap and _heap[0][0] <= now:
+        frozen_until, url = heapq.heappop(_heap)
+        meta = _frozen.get(url)
+        if meta and meta.get("frozen_until") == frozen_until:
+            _thaw(url, meta)
+    _compact()
+
+
+def _compact() -> None:
+    """
+    Rebuild the heap without the stale entries once they outnumber the frozen ones
+    """
+    if len(_heap) > 2 * len(_frozen_urls) + 1024:
+        _heap[:] = [(_frozen[url]["frozen_until"], url) for url in _frozen_urls]
+        heapq.heapify(_heap)
+
+
 def mark_url_bad(url: str, initial: bool = False) -> None:
     if not url:
         return
@@ -24,6 +85,9 @@ def mark_url_bad(url: str, initial: bool = False) -> None:
     meta["last_bad"] = _now_ts()
     backoff = min(MAX_BACKOFF, (2 ** meta["bad_count"]) * BASE_BACKOFF)
     meta["frozen_until"] = _now_ts() + backoff
+    heapq.heappush(_heap, (meta["frozen_until"], url))
+    _frozen_urls.add(url)
+    _touch(url)
 
 
 def mark_url_good(url: str) -> None:
@@ -35,64 +99,112 @@ def mark_url_good(url: str) -> None:
     meta["last_good"] = _now_ts()
     meta["bad_count"] = max(0, meta.get("bad_count", 0) - 1)
     meta["frozen_until"] = None
+    _frozen_urls.discard(url)
     if meta["bad_count"] == 0:
-        _frozen.pop(url, None)
+        _remove(url)
+    else:
+        _touch(url)
 
 
 def is_url_frozen(url: str) -> bool:
-    meta = _frozen.get(url)
-    if not meta:
-        return False
-    fu = meta.get("frozen_until")
-    if not fu:
+    if url not in _frozen_urls:
         return False
-    now = _now_ts()
-    if fu > now:
+    meta = _frozen[url]
+    if meta["frozen_until"] > _now_ts():
         return True
-    meta["frozen_until"] = None
-    meta["bad_count"] = max(0, meta.get("bad_count", 0) - 1)
-    if meta["bad_count"] == 0:
-        _frozen.pop(url, None)
+    _thaw(url, meta)
     return False
 
 
 def get_current_frozen_set() -> Set[str]:
-    now = _now_ts()
-    res = set()
-    for url, meta in list(_frozen.items()):
-        fu = meta.get("frozen_until")
-        if fu and fu > now:
-            res.add(url)
-        else:
-            is_url_frozen(url)
-    return res
-
-
-def load(path: Optional[str]) -> None:
-    if not path or not os.path.exists(path):
+    _expire(_now_ts())
+    return set(_frozen_urls)
+
+
+def _add_loaded(url: str, meta: Dict) -> None:
+    if url in _frozen:
         return
+    _frozen[url] = meta
+    if meta.get("frozen_until"):
+        _heap.append((meta["frozen_until"], url))
+        _frozen_urls.add(url)
+
+
+def _load_legacy(path: str) -> None:
     try:
         with gzip.open(path, "rb") as f:
             data = pickle.load(f)
-            if isinstance(data, dict):
-                for k, v in data.items():
-                    if k not in _frozen:
-                        _frozen[k] = v
     except Exception:
-        pass
-
-
-def save(path: Optional[str]) -> None:
+        return
+    if isinstance(data, dict):
+        for url, meta in data.items():
+            if url not in _frozen and isinstance(meta, dict):
+                _add_loaded(url, {
+                    "bad_count": meta.get("bad_count", 0),
+                    "last_bad": meta.get("last_bad", 0),
+                    "last_good": meta.get("last_good", 0),
+                    "frozen_until": meta.get("frozen_until"),
+                })
+                _changed.add(url)
+
+
+def load(path: Optional[str], legacy_path: Optional[str] = None) -> None:
+    """
+    Load the bad urls from the store, the legacy gzip pickle is imported when it exists
+    """
+    if path and os.path.exists(path):
+        conn = get_db_connection(path, readonly=True)
+        try:
+            cursor = conn.execute("SELECT url, bad_count, last_bad, last_good, frozen_until FROM frozen_url")
+            for url, bad_count, last_bad, last_good, frozen_until in cursor:
+                _add_loaded(url, {
+                    "bad_count": bad_count,
+                    "last_bad": last_bad,
+                    "last_good": last_good,
+                    "frozen_until": frozen_until,
+                })
+        except Exception:
+            pass
+        finally:
+            return_db_connection(path, conn)
+    if legacy_path and os.path.exists(legacy_path):
+        _load_legacy(legacy_path)
+    heapq.heapify(_heap)
+    _expire(_now_ts())
+
+
+def save(path: Optional[str], legacy_path: Optional[str] = None) -> None:
+    """
+    Write only the changed urls to the store and drop the ones whose bad count decayed to zero
+    """
     if not path:
         return
+    dir_path = os.path.dirname(path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    _expire(_now_ts())
+    conn = get_db_connection(path)
     try:
-        dirp = os.path.dirname(path)
-        if dirp:
-            os.makedirs(dirp, exist_ok=True)
-        with gzip.open(path, "wb") as f:
-            pickle.dump(_frozen, f)
+        _ensure_table(conn)
+        with conn:
+            conn.executemany("DELETE FROM frozen_url WHERE url = ?", [(url,) for url in _removed])
+            conn.executemany(
+                "INSERT OR REPLACE INTO frozen_url (url, bad_count, last_bad, last_good, frozen_until) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (url, meta["bad_count"], meta["last_bad"], meta["last_good"], meta["frozen_until"])
+                    for url in _changed
+                    if (meta := _frozen.get(url))
+                ]
+            )
+        _changed.clear()
+        _removed.clear()
+        if legacy_path and os.path.exists(legacy_path):
+            os.remove(legacy_path)
     except Exception:
         pass
+    finally:
+        return_db_connection(path, conn)
 
 
 __all__ = ["mark_url_bad", "mark_url_good", "is_url_frozen", "get_current_frozen_set", "load", "save"]
@@ -0,0 +1,187 @@
+import asyncio
+import math
+from collections import deque
+from time import time
+from typing import Callable, Optional
+
+from utils.config import config
+from utils.i18n import t
+from utils.types import TestResult
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter for the speed test, the limit grows by one while the aggregate throughput
+    keeps up and shrinks multiplicatively on saturation, timeouts or event loop lag
+    """
+
+    def __init__(
+            self,
+            limit: int = config.speed_test_limit,
+            min_limit: int = 1,
+            max_limit: int = config.speed_test_limit_max,
+            adaptive: bool = config.open_adaptive_speed_test_limit,
+            timeout: float = config.speed_test_timeout,
+            interval: float = 2.0,
+            decrease_factor: float = 0.75,
+            max_timeout_rate: float = 0.5,
+            max_loop_lag: float = 0.5,
+            saturation_tolerance: float = 0.1,
+            logger=None,
+    ):
+        self.limit = max(1, limit)
+        self.min_limit = max(1, min(min_limit, self.limit))
+        self.max_limit = max(self.limit, max_limit)
+        self.adaptive = adaptive and self.max_limit > self.min_limit
+        self.timeout = timeout
+        self.interval = interval
+        self.decrease_factor = decrease_factor
+        self.max_timeout_rate = max_timeout_rate
+        self.max_loop_lag = max_loop_lag
+        self.saturation_tolerance = saturation_tolerance
+        self.logger = logger
+        self.history: list[tuple[float, int]] = [(0.0, self.limit)]
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._window_size = 0.0
+        self._get_received: Optional[Callable[[], int]] = None
+        self._last_received = 0
+        self._window_count = 0
+        self._window_timeouts = 0
+        self._throughput: Optional[float] = None
+        self._last_throughput: Optional[float] = None
+        self._last_limit = self.limit
+        self._start_time = time()
+        self._task: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> None:
+        """
+        Wait until an in-flight slot is free
+        """
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self) -> None:
+        """
+        Release an in-flight slot
+        """
+        self._in_flight = max(0, self._in_flight - 1)
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                self._in_flight += 1
+                future.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def record(self, result: TestResult, elapsed: float) -> None:
+        """
+        Record a finished probe for the current window, its size is only counted here when there is no
+        received byte counter, otherwise the bytes are counted in the windows they arrived in
+        """
+        speed = (result or {}).get("speed") or 0
+        delay = (result or {}).get("delay")
+        if self._get_received is None and speed and not math.isinf(speed):
+            self._window_size += speed * elapsed
+        self._window_count += 1
+        if delay in (None, -1) and elapsed >= self.timeout * 0.9:
+            self._window_timeouts += 1
+
+    def _set_limit(self, new_limit: int, throughput: float, timeout_rate: float, lag: float) -> None:
+        new_limit = max(self.min_limit, min(self.max_limit, new_limit))
+        if new_limit == self.limit:
+            return
+        self._last_limit = self.limit
+        self._last_throughput = throughput
+        if self.logger:
+            self.logger.info(
+                t("msg.speed_test_limit_change").format(
+                    old=self.limit, new=new_limit, throughput=throughput, timeout_rate=timeout_rate, lag=lag
+                )
+            )
+        self.limit = new_limit
+        self.history.append((round(time() - self._start_time, 1), new_limit))
+        self._wake_up()
+
+    def _adjust(self, lag: float) -> None:
+        """
+        Adjust the limit with the samples of the finished window
+        """
+        count, size, timeouts = self._window_count, self._window_size, self._window_timeouts
+        self._window_count, self._window_size, self._window_timeouts = 0, 0.0, 0
+        if self._get_received is not None:
+            received = self._get_received()
+            size = (received - self._last_received) / 1024 / 1024
+            self._last_received = received
+        if not count and not size:
+            return
+        window_throughput = size / self.interval
+        self._throughput = window_throughput if self._throughput is None else (
+                0.5 * self._throughput + 0.5 * window_throughput)
+        timeout_rate = timeouts / count if count else 0.0
+        decreased = max(self.min_limit, math.floor(self.limit * self.decrease_factor))
+        if lag > self.max_loop_lag or timeout_rate > self.max_timeout_rate:
+            self._set_limit(decreased, self._throughput, timeout_rate, lag)
+        elif (self._last_throughput is not None and self.limit > self._last_limit
+              and self._throughput < self._last_throughput * (1 - self.saturation_tolerance)):
+            self._set_limit(decreased, self._throughput, timeout_rate, lag)
+        elif self._waiters and self._in_flight >= self.limit:
+            self._set_limit(self.limit + 1, self._throughput, timeout_rate, lag)
+
+    async def _monitor(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            try:
+                self._adjust(lag)
+            except Exception:
+                pass
+
+    async def start(self, get_received: Optional[Callable[[], int]] = None) -> None:
+        """
+        Start the limit monitor, the throughput of each window is read from the received byte counter when given
+        """
+        self._start_time = time()
+        self._get_received = get_received
+        self._last_received = get_received() if get_received else 0
+        if self.adaptive and not self._task:
+            self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self) -> None:
+        """
+        Stop the limit monitor and log the limit history
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.adaptive and self.logger:
+            history = " -> ".join(f"{limit}({second}s)" for second, limit in self.history)
+            self.logger.info(t("msg.speed_test_limit_history").format(history=history))
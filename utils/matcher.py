@@ -0,0 +1,99 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+AHO_CORASICK_MIN_KEYWORDS = 64
+
+
+class KeywordMatcher:
+    """
+    Compiled substring matcher of a keyword list, the exact matches are answered from a hash set and
+    the url is scanned once by an Aho-Corasick automaton, small lists are checked directly
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        keywords = list(dict.fromkeys(keywords))
+        self.match_all = "" in keywords
+        self.keywords: Tuple[str, ...] = tuple(keyword for keyword in keywords if keyword)
+        self.exact = frozenset(self.keywords)
+        self._goto: Optional[List[Dict[str, int]]] = None
+        self._fail: List[int] = []
+        self._out: List[bool] = []
+        if len(self.keywords) >= AHO_CORASICK_MIN_KEYWORDS:
+            self._build()
+
+    def _build(self) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out = [False]
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][ch] = next_state
+                    goto.append({})
+                    out.append(False)
+                state = next_state
+            out[state] = True
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(ch, 0)
+                out[next_state] = out[next_state] or out[fail[next_state]]
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def search(self, text: str) -> bool:
+        """
+        Check if any keyword is a substring of the text
+        """
+        if self.match_all:
+            return True
+        if not text:
+            return False
+        if text in self.exact:
+            return True
+        goto = self._goto
+        if goto is None:
+            return any(keyword in text for keyword in self.keywords)
+        fail = self._fail
+        out = self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+
+_keyword_matcher: Optional[Tuple[list, int, KeywordMatcher]] = None
+
+
+def get_keyword_matcher(keywords) -> KeywordMatcher:
+    """
+    Get the compiled matcher of the keyword list, it is compiled once and reused while the same list is passed
+    """
+    global _keyword_matcher
+    if isinstance(keywords, KeywordMatcher):
+        return keywords
+    cached = _keyword_matcher
+    if cached and cached[0] is keywords and cached[1] == len(keywords):
+        return cached[2]
+    matcher = KeywordMatcher(keywords)
+    _keyword_matcher = (keywords, len(keywords), matcher)
+    return matcher
+
+
+__all__ = ["KeywordMatcher", "get_keyword_matcher"]
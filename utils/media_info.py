@@ -0,0 +1,328 @@
+import struct
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+H264_STREAM_TYPE = 0x1B
+HEVC_STREAM_TYPE = 0x24
+H264_SPS_TYPE = 7
+HEVC_SPS_TYPE = 33
+H264_HIGH_PROFILES = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+FLV_SCRIPT_TAG = 18
+FLV_VIDEO_TAG = 9
+FLV_AVC_CODEC_ID = 7
+
+
+class BitReader:
+    """
+    Big endian bit reader with exp-golomb support for the parameter sets
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def read_bit(self) -> int:
+        byte = self.data[self.pos >> 3]
+        bit = (byte >> (7 - (self.pos & 7))) & 1
+        self.pos += 1
+        return bit
+
+    def read_bits(self, count: int) -> int:
+        value = 0
+        for _ in range(count):
+            value = (value << 1) | self.read_bit()
+        return value
+
+    def skip_bits(self, count: int) -> None:
+        if self.pos + count > len(self.data) * 8:
+            raise IndexError("Bits out of range")
+        self.pos += count
+
+    def read_ue(self) -> int:
+        zeros = 0
+        while not self.read_bit():
+            zeros += 1
+            if zeros > 31:
+                raise ValueError("Invalid exp-golomb code")
+        return (1 << zeros) - 1 + self.read_bits(zeros)
+
+    def read_se(self) -> int:
+        value = self.read_ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def remove_emulation_prevention(nal: bytes) -> bytes:
+    """
+    Remove the emulation prevention bytes (00 00 03) of the nal unit
+    """
+    return nal.replace(b"\x00\x00\x03", b"\x00\x00")
+
+
+def get_sub_size(chroma_format_idc: int) -> tuple[int, int]:
+    if chroma_format_idc == 1:
+        return 2, 2
+    if chroma_format_idc == 2:
+        return 2, 1
+    return 1, 1
+
+
+def parse_h264_sps(nal: bytes) -> tuple[int, int] | None:
+    """
+    Parse the width and height from the h264 sps nal unit (with the one byte nal header)
+    """
+    reader = BitReader(remove_emulation_prevention(nal[1:]))
+    profile_idc = reader.read_bits(8)
+    reader.skip_bits(16)
+    reader.read_ue()
+    chroma_format_idc = 1
+    if profile_idc in H264_HIGH_PROFILES:
+        chroma_format_idc = reader.read_ue()
+        if chroma_format_idc == 3:
+            reader.skip_bits(1)
+        reader.read_ue()
+        reader.read_ue()
+        reader.skip_bits(1)
+        if reader.read_bit():
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                if reader.read_bit():
+                    last_scale = next_scale = 8
+                    for _ in range(16 if i < 6 else 64):
+                        if next_scale:
+                            next_scale = (last_scale + reader.read_se()) % 256
+                        last_scale = next_scale or last_scale
+    reader.read_ue()
+    pic_order_cnt_type = reader.read_ue()
+    if pic_order_cnt_type == 0:
+        reader.read_ue()
+    elif pic_order_cnt_type == 1:
+        reader.skip_bits(1)
+        reader.read_se()
+        reader.read_se()
+        for _ in range(reader.read_ue()):
+            reader.read_se()
+    reader.read_ue()
+    reader.skip_bits(1)
+    width_in_mbs = reader.read_ue() + 1
+    height_in_map_units = reader.read_ue() + 1
+    frame_mbs_only = reader.read_bit()
+    if not frame_mbs_only:
+        reader.skip_bits(1)
+    reader.skip_bits(1)
+    crop_left = crop_right = crop_top = crop_bottom = 0
+    if reader.read_bit():
+        crop_left, crop_right, crop_top, crop_bottom = (reader.read_ue() for _ in range(4))
+    sub_width, sub_height = get_sub_size(chroma_format_idc)
+    if chroma_format_idc == 0:
+        sub_width, sub_height = 1, 1
+    crop_unit_y = sub_height * (2 - frame_mbs_only)
+    width = width_in_mbs * 16 - (crop_left + crop_right) * sub_width
+    height = (2 - frame_mbs_only) * height_in_map_units * 16 - (crop_top + crop_bottom) * crop_unit_y
+    return (width, height) if width > 0 and height > 0 else None
+
+
+def parse_hevc_sps(nal: bytes) -> tuple[int, int] | None:
+    """
+    Parse the width and height from the h265 sps nal unit (with the two bytes nal header)
+    """
+    reader = BitReader(remove_emulation_prevention(nal[2:]))
+    reader.skip_bits(4)
+    max_sub_layers_minus1 = reader.read_bits(3)
+    reader.skip_bits(1)
+    reader.skip_bits(96)
+    sub_layer_flags = [(reader.read_bit(), reader.read_bit()) for _ in range(max_sub_layers_minus1)]
+    if max_sub_layers_minus1 > 0:
+        reader.skip_bits(2 * (8 - max_sub_layers_minus1))
+    for profile_present, level_present in sub_layer_flags:
+        if profile_present:
+            reader.skip_bits(88)
+        if level_present:
+            reader.skip_bits(8)
+    reader.read_ue()
+    chroma_format_idc = reader.read_ue()
+    if chroma_format_idc == 3:
+        reader.skip_bits(1)
+    width = reader.read_ue()
+    height = reader.read_ue()
+    if reader.read_bit():
+        sub_width, sub_height = get_sub_size(chroma_format_idc)
+        left, right, top, bottom = (reader.read_ue() for _ in range(4))
+        width -= (left + right) * sub_width
+        height -= (top + bottom) * sub_height
+    return (width, height) if width > 0 and height > 0 else None
+
+
+def iter_nal_units(data: bytes):
+    """
+    Iterate the nal units of the annex b byte stream
+    """
+    start = data.find(b"\x00\x00\x01")
+    while start != -1:
+        start += 3
+        end = data.find(b"\x00\x00\x01", start)
+        nal = data[start:end if end != -1 else len(data)]
+        yield nal.rstrip(b"\x00") if end != -1 else nal
+        start = end
+
+
+def get_size_from_nal_units(data: bytes, hevc: bool = False) -> tuple[int, int] | None:
+    """
+    Get the video size from the first parsable sps of the annex b byte stream
+    """
+    for nal in iter_nal_units(data):
+        if not nal:
+            continue
+        nal_type = (nal[0] >> 1) & 0x3F if hevc else nal[0] & 0x1F
+        if nal_type == (HEVC_SPS_TYPE if hevc else H264_SPS_TYPE):
+            try:
+                size = parse_hevc_sps(nal) if hevc else parse_h264_sps(nal)
+            except (IndexError, ValueError):
+                continue
+            if size:
+                return size
+    return None
+
+
+def get_ts_offset(data: bytes) -> int:
+    """
+    Get the offset of the first ts packet, -1 if the data is not a ts stream
+    """
+    for offset in range(min(TS_PACKET_SIZE, len(data))):
+        if all(
+                data[offset + i * TS_PACKET_SIZE] == TS_SYNC_BYTE
+                for i in range(3)
+                if offset + i * TS_PACKET_SIZE < len(data)
+        ) and offset + TS_PACKET_SIZE < len(data):
+            return offset
+    return -1
+
+
+def get_ts_payload(packet: bytes) -> bytes:
+    adaptation_field_control = (packet[3] >> 4) & 0x3
+    if not adaptation_field_control & 0x1:
+        return b""
+    start = 4
+    if adaptation_field_control & 0x2:
+        start += 1 + packet[4]
+    return packet[start:]
+
+
+def get_ts_section(payload: bytes) -> bytes:
+    pointer = payload[0]
+    section = payload[1 + pointer:]
+    length = ((section[1] & 0x0F) << 8) | section[2]
+    return section[:3 + length]
+
+
+def get_ts_video_size(data: bytes) -> tuple[int, int] | None:
+    """
+    Get the video size of the ts stream by following the pat, pmt and the video pes to the sps
+    """
+    offset = get_ts_offset(data)
+    if offset == -1:
+        return None
+    pmt_pids = set()
+    video_pid = None
+    hevc = False
+    video_data = bytearray()
+    for start in range(offset, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        packet = data[start:start + TS_PACKET_SIZE]
+        if packet[0] != TS_SYNC_BYTE:
+            continue
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        unit_start = packet[1] & 0x40
+        payload = get_ts_payload(packet)
+        if not payload:
+            continue
+        try:
+            if pid == 0 and unit_start and not pmt_pids:
+                section = get_ts_section(payload)
+                for i in range(8, len(section) - 4, 4):
+                    program = (section[i] << 8) | section[i + 1]
+                    if program:
+                        pmt_pids.add(((section[i + 2] & 0x1F) << 8) | section[i + 3])
+            elif pid in pmt_pids and unit_start and video_pid is None:
+                section = get_ts_section(payload)
+                i = 12 + (((section[10] & 0x0F) << 8) | section[11])
+                while i + 5 <= len(section) - 4:
+                    stream_type = section[i]
+                    es_pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+                    if stream_type in (H264_STREAM_TYPE, HEVC_STREAM_TYPE):
+                        video_pid = es_pid
+                        hevc = stream_type == HEVC_STREAM_TYPE
+                        break
+                    i += 5 + (((section[i + 3] & 0x0F) << 8) | section[i + 4])
+            elif pid == video_pid:
+                if unit_start and payload[:3] == b"\x00\x00\x01":
+                    payload = payload[9 + payload[8]:]
+                    if video_data:
+                        size = get_size_from_nal_units(bytes(video_data), hevc)
+                        if size:
+                            return size
+                        video_data.clear()
+                video_data.extend(payload)
+        except IndexError:
+            continue
+    if video_data:
+        return get_size_from_nal_units(bytes(video_data), hevc)
+    return None
+
+
+def get_flv_video_size(data: bytes) -> tuple[int, int] | None:
+    """
+    Get the video size of the flv stream from the onMetaData script tag or the avc sequence header
+    """
+    if data[:3] != b"FLV" or len(data) < 9:
+        return None
+    pos = struct.unpack(">I", data[5:9])[0] + 4
+    while pos + 11 <= len(data):
+        tag_type = data[pos] & 0x1F
+        data_size = int.from_bytes(data[pos + 1:pos + 4], "big")
+        body = data[pos + 11:pos + 11 + data_size]
+        if tag_type == FLV_SCRIPT_TAG:
+            size = get_amf_video_size(body)
+            if size:
+                return size
+        elif tag_type == FLV_VIDEO_TAG and len(body) > 5 and body[0] & 0x0F == FLV_AVC_CODEC_ID and body[1] == 0:
+            try:
+                record = body[5:]
+                if record[5] & 0x1F:
+                    sps_length = struct.unpack(">H", record[6:8])[0]
+                    size = parse_h264_sps(record[8:8 + sps_length])
+                    if size:
+                        return size
+            except (IndexError, ValueError, struct.error):
+                pass
+        pos += 11 + data_size + 4
+    return None
+
+
+def get_amf_number(body: bytes, key: bytes) -> float | None:
+    """
+    Get the number value of the amf0 object property
+    """
+    marker = struct.pack(">H", len(key)) + key + b"\x00"
+    index = body.find(marker)
+    if index == -1 or index + len(marker) + 8 > len(body):
+        return None
+    return struct.unpack(">d", body[index + len(marker):index + len(marker) + 8])[0]
+
+
+def get_amf_video_size(body: bytes) -> tuple[int, int] | None:
+    width = get_amf_number(body, b"width")
+    height = get_amf_number(body, b"height")
+    if width and height and width > 0 and height > 0:
+        return int(width), int(height)
+    return None
+
+
+def get_resolution_from_bytes(data: bytes) -> str | None:
+    """
+    Get the resolution from the head bytes of a ts or flv stream, None if it can not be parsed
+    """
+    if not data:
+        return None
+    try:
+        size = get_flv_video_size(data) if data[:3] == b"FLV" else get_ts_video_size(data)
+    except Exception:
+        size = None
+    return f"{size[0]}x{size[1]}" if size else None
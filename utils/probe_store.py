@@ -0,0 +1,286 @@
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.config import config
+from utils.db import get_db_connection, return_db_connection, run_db
+from utils.types import TestResult
+
+TTL = config.speed_test_cache_ttl * 3600
+SKIP_CONFIDENCE = 0.75
+RESOLUTION_TTL = config.resolution_cache_ttl * 3600
+RESOLUTION_FAILURE_BACKOFF = 6 * 3600
+
+# key -> [(created_at, speed, delay, resolution)], newest first, a failure is stored with delay -1
+_url_samples: Dict[str, List[Tuple[int, float, int, Optional[str]]]] = defaultdict(list)
+_host_samples: Dict[str, List[Tuple[int, float, int, Optional[str]]]] = defaultdict(list)
+_pending: List[Tuple[str, str, float, int, Optional[str], int]] = []
+_stats = {"skipped": 0, "shortened": 0, "probed": 0}
+# url -> {"host", "resolution", "failures", "updated_at"}
+_resolutions: Dict[str, Dict] = {}
+_resolution_changed: Set[str] = set()
+_resolution_stats = {"hit": 0, "miss": 0}
+
+
+def _now_ts() -> int:
+    return int(time.time())
+
+
+def _ensure_table(conn) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS probe_result ("
+        "url TEXT, host TEXT, speed REAL, delay INTEGER, resolution TEXT, created_at INTEGER)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_probe_result_created_at ON probe_result (created_at)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS resolution_result ("
+        "url TEXT PRIMARY KEY, host TEXT, resolution TEXT, failures INTEGER, updated_at INTEGER)"
+    )
+
+
+def is_enabled() -> bool:
+    return TTL > 0
+
+
+def get_confidence(created_at: int, now: Optional[int] = None) -> float:
+    """
+    Get the confidence of a stored sample, decaying linearly from 1 to 0 over the ttl
+    """
+    if not is_enabled():
+        return 0.0
+    age = (now or _now_ts()) - created_at
+    return max(0.0, 1 - age / TTL)
+
+
+def get_fresh_result(key: str, by_host: bool = False) -> Optional[TestResult]:
+    """
+    Get the confidence weighted result of the fresh samples stored for the url or host,
+    only the successes newer than the latest failure are used
+    """
+    samples = (_host_samples if by_host else _url_samples).get(key)
+    if not samples:
+        return None
+    now = _now_ts()
+    successes = []
+    for sample in samples:
+        if sample[2] == -1:
+            break
+        successes.append(sample)
+    weighted = [(get_confidence(sample[0], now), sample) for sample in successes]
+    weighted = [(weight, sample) for weight, sample in weighted if weight > 0]
+    if not weighted:
+        return None
+    total_weight = sum(weight for weight, _ in weighted)
+    return {
+        "speed": sum(weight * sample[1] for weight, sample in weighted) / total_weight,
+        "delay": int(sum(weight * sample[2] for weight, sample in weighted) / total_weight),
+        "resolution": next((sample[3] for _, sample in weighted if sample[3]), None),
+        "confidence": round(weighted[0][0], 2),
+    }
+
+
+def add_result(url: str, host: Optional[str], result: TestResult) -> None:
+    """
+    Add a measured result, an unreachable result is kept as a failure that overrides the older successes
+    """
+    if not is_enabled() or not url:
+        return
+    speed = result.get("speed") or 0
+    delay = result.get("delay")
+    if delay in (None, -1) or not speed:
+        sample = (_now_ts(), 0, -1, None)
+    else:
+        sample = (_now_ts(), speed, int(delay), result.get("resolution") or None)
+    _url_samples[url].insert(0, sample)
+    if host:
+        _host_samples[host].insert(0, sample)
+    _pending.append((url, host, sample[1], sample[2], sample[3], sample[0]))
+
+
+def record(kind: str) -> None:
+    """
+    Record how a url was handled: skipped, shortened or probed
+    """
+    _stats[kind] = _stats.get(kind, 0) + 1
+
+
+def get_stats() -> Dict[str, int]:
+    return dict(_stats)
+
+
+def is_resolution_enabled() -> bool:
+    return RESOLUTION_TTL > 0
+
+
+def get_cached_resolution(url: str) -> Tuple[bool, Optional[str]]:
+    """
+    Get the cached resolution of the url, return (hit, resolution),
+    a hit with None resolution means the url recently failed to probe and should not be probed again yet
+    """
+    meta = _resolutions.get(url) if is_resolution_enabled() else None
+    if meta:
+        age = _now_ts() - meta["updated_at"]
+        failures = meta["failures"]
+        expire = RESOLUTION_TTL if not failures else min(
+            RESOLUTION_TTL, RESOLUTION_FAILURE_BACKOFF * 2 ** (failures - 1))
+        if age < expire:
+            _resolution_stats["hit"] += 1
+            return True, meta["resolution"]
+    _resolution_stats["miss"] += 1
+    return False, None
+
+
+def add_resolution(url: str, host: Optional[str], resolution: Optional[str]) -> None:
+    """
+    Add a probed resolution of the url, a None resolution is recorded as a probe failure
+    """
+    if not is_resolution_enabled() or not url:
+        return
+    meta = _resolutions.get(url)
+    failures = 0 if resolution else (meta["failures"] + 1 if meta else 1)
+    _resolutions[url] = {
+        "host": host,
+        "resolution": resolution or None,
+        "failures": failures,
+        "updated_at": _now_ts(),
+    }
+    _resolution_changed.add(url)
+
+
+def get_resolution_stats() -> Dict[str, int]:
+    return dict(_resolution_stats)
+
+
+def _reset() -> None:
+    _url_samples.clear()
+    _host_samples.clear()
+    _pending.clear()
+    _resolutions.clear()
+    _resolution_changed.clear()
+    for kind in _stats:
+        _stats[kind] = 0
+    for kind in _resolution_stats:
+        _resolution_stats[kind] = 0
+
+
+def _read(conn) -> None:
+    if conn is None:
+        return
+    if is_enabled():
+        try:
+            cursor = conn.execute(
+                "SELECT url, host, speed, delay, resolution, created_at FROM probe_result "
+                "WHERE created_at > ? ORDER BY created_at DESC",
+                (_now_ts() - TTL,)
+            )
+            for url, host, speed, delay, resolution, created_at in cursor:
+                sample = (created_at, speed, delay, resolution)
+                _url_samples[url].append(sample)
+                if host:
+                    _host_samples[host].append(sample)
+        except Exception:
+            pass
+    if is_resolution_enabled():
+        try:
+            cursor = conn.execute(
+                "SELECT url, host, resolution, failures, updated_at FROM resolution_result WHERE updated_at > ?",
+                (_now_ts() - RESOLUTION_TTL,)
+            )
+            for url, host, resolution, failures, updated_at in cursor:
+                _resolutions[url] = {
+                    "host": host,
+                    "resolution": resolution,
+                    "failures": failures or 0,
+                    "updated_at": updated_at,
+                }
+        except Exception:
+            pass
+
+
+def _write(conn) -> None:
+    try:
+        _ensure_table(conn)
+        now = _now_ts()
+        with conn:
+            conn.executemany(
+                "INSERT INTO probe_result (url, host, speed, delay, resolution, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                _pending
+            )
+            conn.execute("DELETE FROM probe_result WHERE created_at <= ?", (now - TTL,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO resolution_result (url, host, resolution, failures, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (url, meta["host"], meta["resolution"], meta["failures"], meta["updated_at"])
+                    for url in _resolution_changed
+                    if (meta := _resolutions.get(url))
+                ]
+            )
+            conn.execute("DELETE FROM resolution_result WHERE updated_at <= ?", (now - RESOLUTION_TTL,))
+        _pending.clear()
+        _resolution_changed.clear()
+    except Exception:
+        pass
+
+
+def _can_load(path: Optional[str]) -> bool:
+    return (is_enabled() or is_resolution_enabled()) and bool(path) and os.path.exists(path)
+
+
+def _can_save(path: Optional[str]) -> bool:
+    if not (is_enabled() or is_resolution_enabled()) or not path:
+        return False
+    dir_path = os.path.dirname(path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    return True
+
+
+def load(path: Optional[str]) -> None:
+    """
+    Load the fresh samples and cached resolutions from the store
+    """
+    _reset()
+    if not _can_load(path):
+        return
+    conn = get_db_connection(path, readonly=True)
+    try:
+        _read(conn)
+    finally:
+        return_db_connection(path, conn)
+
+
+async def load_async(path: Optional[str]) -> None:
+    """
+    Asyncio version of load, the store is read in the executor
+    """
+    _reset()
+    if _can_load(path):
+        await run_db(path, _read, readonly=True)
+
+
+def save(path: Optional[str]) -> None:
+    """
+    Append the new samples and cached resolutions to the store and drop the expired ones
+    """
+    if not _can_save(path):
+        return
+    conn = get_db_connection(path)
+    try:
+        _write(conn)
+    finally:
+        return_db_connection(path, conn)
+
+
+async def save_async(path: Optional[str]) -> None:
+    """
+    Asyncio version of save, the store is written in the executor
+    """
+    if _can_save(path):
+        await run_db(path, _write)
+
+
+__all__ = ["is_enabled", "get_confidence", "get_fresh_result", "add_result", "record", "get_stats",
+           "is_resolution_enabled", "get_cached_resolution", "add_resolution", "get_resolution_stats", "load",
+           "load_async", "save", "save_async"]
@@ -0,0 +1,108 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from time import time
+from typing import Dict, Optional
+
+from utils.config import config
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _get_children_cpu_time() -> float:
+    """
+    Get the cpu time used by the reaped child processes, 0 when the platform can not tell
+    """
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class MediaProcessPool:
+    """
+    Bounded pool for the media tool (ffmpeg/ffprobe) subprocesses, sized independently of the network concurrency,
+    extra processes wait in a fifo queue and a process is killed once it runs past its timeout
+    """
+
+    def __init__(self, limit: int = config.media_process_limit, kill_grace: float = 1.0):
+        self.limit = limit if limit > 0 else (os.cpu_count() or 1)
+        self.kill_grace = kill_grace
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cpu_start = _get_children_cpu_time()
+        self._stats = {"spawned": 0, "killed": 0, "queued": 0, "wait": 0.0, "max_wait": 0.0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    def _kill(self, proc: asyncio.subprocess.Process) -> None:
+        if proc.returncode is None:
+            try:
+                proc.kill()
+                self._stats["killed"] += 1
+            except ProcessLookupError:
+                pass
+
+    @asynccontextmanager
+    async def spawn(self, *args, timeout: float = None):
+        """
+        Spawn a media tool process once a slot is free, the process is killed and reaped on exit
+        or when it outlives the timeout
+        """
+        semaphore = self._get_semaphore()
+        queued_at = time()
+        if semaphore.locked():
+            self._stats["queued"] += 1
+        await semaphore.acquire()
+        wait = time() - queued_at
+        self._stats["wait"] += wait
+        self._stats["max_wait"] = max(self._stats["max_wait"], wait)
+        proc = None
+        watchdog = None
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            self._stats["spawned"] += 1
+            if timeout:
+                watchdog = asyncio.get_running_loop().call_later(timeout + self.kill_grace, self._kill, proc)
+            yield proc
+        finally:
+            if watchdog:
+                watchdog.cancel()
+            if proc:
+                self._kill(proc)
+                try:
+                    await proc.wait()
+                except Exception:
+                    pass
+            semaphore.release()
+
+    def reset_stats(self) -> None:
+        self._cpu_start = _get_children_cpu_time()
+        for key in self._stats:
+            self._stats[key] = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Get the pool stats, the cpu time is the total used by the reaped child processes since the last reset
+        """
+        spawned = self._stats["spawned"]
+        cpu = _get_children_cpu_time() - self._cpu_start
+        return {
+            **self._stats,
+            "limit": self.limit,
+            "cpu": cpu,
+            "avg_cpu": cpu / spawned if spawned else 0.0,
+        }
+
+
+media_pool = MediaProcessPool()
@@ -0,0 +1,135 @@
+import gzip
+import mimetypes
+import os
+import threading
+from email.utils import formatdate
+from time import time
+from typing import Dict, Optional
+
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BROTLI_QUALITY = 5
+
+
+class CachedFile:
+    """
+    Pre-encoded content of a file with its validators
+    """
+
+    __slots__ = ("data", "encoded", "etag", "last_modified", "mtime", "mtime_ns", "size", "checked_at")
+
+    def __init__(self, data: bytes, mtime_ns: int, size: int, compress: bool = True):
+        self.data = data
+        self.encoded: Dict[str, bytes] = {}
+        if compress:
+            self.encoded["gzip"] = gzip.compress(data, compresslevel=6)
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(data, quality=BROTLI_QUALITY)
+        self.mtime_ns = mtime_ns
+        self.mtime = mtime_ns // 1_000_000_000
+        self.size = size
+        self.etag = f'"{mtime_ns:x}-{size:x}"'
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+        self.checked_at = time()
+
+
+class ResponseCache:
+    """
+    In-memory cache of the served files keyed by path and mtime, unchanged requests are answered with 304
+    and the content is served from memory without touching the disk
+    """
+
+    def __init__(self, check_interval: float = 1.0, max_size: int = 32 * 1024 * 1024, min_compress_size: int = 1024):
+        self.check_interval = check_interval
+        self.max_size = max_size
+        self.min_compress_size = min_compress_size
+        self._files: Dict[str, CachedFile] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[CachedFile]:
+        """
+        Get the cached file, the file is only stat-ed once per check interval and reloaded when it changed
+        """
+        entry = self._files.get(path)
+        now = time()
+        if entry and now - entry.checked_at < self.check_interval:
+            return entry
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._files.pop(path, None)
+            return None
+        if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            entry.checked_at = now
+            return entry
+        if stat.st_size > self.max_size:
+            return None
+        with self._lock:
+            entry = self._files.get(path)
+            if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                return entry
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None
+            compress = len(data) >= self.min_compress_size and not path.endswith(".gz")
+            entry = CachedFile(data, stat.st_mtime_ns, stat.st_size, compress)
+            self._files[path] = entry
+        return entry
+
+    @staticmethod
+    def is_not_modified(entry: CachedFile) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            return any(tag.strip() in (entry.etag, "*") for tag in if_none_match.split(","))
+        if_modified_since = request.if_modified_since
+        if if_modified_since:
+            return entry.mtime <= int(if_modified_since.timestamp())
+        return False
+
+    @staticmethod
+    def get_encoding(entry: CachedFile) -> Optional[str]:
+        best, best_quality = None, 0
+        for encoding in ("br", "gzip"):
+            quality = request.accept_encodings.quality(encoding)
+            if encoding in entry.encoded and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def make_response(self, path: str, mimetype: str = None, as_attachment: bool = False) -> Optional[Response]:
+        """
+        Make the response of the file from the cache, the files over the max size are sent from the disk,
+        None if the file does not exist
+        """
+        entry = self.get(path)
+        if entry is None:
+            if not os.path.isfile(path):
+                return None
+            return send_file(path, mimetype=mimetype, as_attachment=as_attachment, conditional=True, max_age=0)
+        mimetype = mimetype or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        headers = {
+            "ETag": entry.etag,
+            "Last-Modified": entry.last_modified,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if as_attachment:
+            headers["Content-Disposition"] = f'attachment; filename="{os.path.basename(path)}"'
+        if self.is_not_modified(entry):
+            return Response(status=304, headers=headers)
+        encoding = self.get_encoding(entry)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            body = entry.encoded[encoding]
+        else:
+            body = entry.data
+        return Response(body, mimetype=mimetype, headers=headers)
+
+
+response_cache = ResponseCache()
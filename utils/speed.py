@@ -1,20 +1,26 @@
 import asyncio
+import contextvars
 import http.cookies
 import json
+import math
 import re
 import subprocess
+from contextlib import asynccontextmanager
 from time import time
 from urllib.parse import quote, urljoin
 
 import m3u8
-from aiohttp import ClientSession, TCPConnector
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
 from multidict import CIMultiDictProxy
 
 import utils.constants as constants
+import utils.probe_store as probe_store
 from utils.config import config
 from utils.i18n import t
+from utils.media_info import get_resolution_from_bytes
+from utils.process_pool import media_pool
 from utils.requests.tools import headers as request_headers
-from utils.tools import get_resolution_value
+from utils.tools import get_resolution_value, get_url_host
 from utils.types import TestResult, ChannelTestResult, TestResultCacheData
 
 http.cookies._is_legal_key = lambda _: True
@@ -28,6 +34,8 @@ open_supply = config.open_supply
 open_filter_speed = config.open_filter_speed
 min_speed_value = config.min_speed
 resolution_speed_map = config.resolution_speed_map
+open_speed_test_early_abort = config.open_speed_test_early_abort
+speed_test_max_size = int(config.speed_test_max_size * 1024 * 1024)
 m3u8_headers = ['application/x-mpegurl', 'application/vnd.apple.mpegurl', 'audio/mpegurl', 'audio/x-mpegurl']
 default_ipv6_delay = 0.1
 default_ipv6_resolution = "1920x1080"
@@ -40,37 +48,207 @@ default_ipv6_result = {
 min_measure_time = 1.0
 stability_window = 4
 stability_threshold = 0.12
+resolution_head_size = 512 * 1024
+abort_sample_interval = 0.2
+abort_min_samples = 3
+abort_z_score = 1.96
+keepalive_timeout = 30
+_run_session: contextvars.ContextVar["SessionManager | None"] = contextvars.ContextVar("run_session", default=None)
+
+
+class SessionManager:
+    """
+    Run-scoped pooled session shared by all speed test helpers
+    """
+
+    def __init__(self, limit_per_host: int = config.speed_test_limit_per_host,
+                 dns_ttl: int = config.speed_test_dns_ttl):
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.session: ClientSession | None = None
+        self.opened = 0
+        self.reused = 0
+        self.dns_hits = 0
+        self.dns_misses = 0
+        self.hls_probes: dict[tuple, asyncio.Future] = {}
+        self.hls_shared = 0
+        self.hls_segments = 0
+        self.hls_segments_skipped = 0
+        self.received = 0
+        self._token = None
+
+    def _create_trace_config(self) -> TraceConfig:
+        """
+        Create the trace config used to count connection and dns cache usage
+        """
+
+        async def on_connection_create_end(session, ctx, params):
+            self.opened += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.reused += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.dns_hits += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.dns_misses += 1
+
+        trace_config = TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    async def __aenter__(self) -> "SessionManager":
+        connector = TCPConnector(
+            ssl=False,
+            limit=0,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=keepalive_timeout,
+        )
+        self.session = ClientSession(connector=connector, trust_env=True,
+                                     trace_configs=[self._create_trace_config()])
+        self._token = _run_session.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for probe in self.hls_probes.values():
+            if not probe.done():
+                probe.cancel()
+        if self._token is not None:
+            _run_session.reset(self._token)
+            self._token = None
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get the connection usage stats of the run
+        """
+        return {
+            "opened": self.opened,
+            "reused": self.reused,
+            "dns_hits": self.dns_hits,
+            "dns_misses": self.dns_misses,
+        }
+
+    def get_hls_stats(self) -> dict[str, int]:
+        """
+        Get the hls probe stats of the run
+        """
+        return {
+            "playlists": len(self.hls_probes),
+            "shared": self.hls_shared,
+            "segments": self.hls_segments,
+            "skipped": self.hls_segments_skipped,
+        }
+
+
+def get_run_manager() -> SessionManager | None:
+    """
+    Get the session manager of the current speed test run
+    """
+    return _run_session.get()
+
+
+def get_run_session() -> ClientSession | None:
+    """
+    Get the session of the current speed test run
+    """
+    manager = _run_session.get()
+    if manager and manager.session and not manager.session.closed:
+        return manager.session
+    return None
+
+
+@asynccontextmanager
+async def session_scope(session: ClientSession = None):
+    """
+    Yield the given session, the run session or a temporary session closed on exit
+    """
+    session = session or get_run_session()
+    if session is not None:
+        yield session
+        return
+    session = ClientSession(connector=TCPConnector(ssl=False), trust_env=True)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+def get_speed_upper_bound(samples: list[float], z: float = abort_z_score) -> float:
+    """
+    Get the upper confidence bound of the mean throughput of the samples
+    """
+    count = len(samples)
+    mean = sum(samples) / count
+    if count < 2:
+        return mean
+    variance = sum((sample - mean) ** 2 for sample in samples) / (count - 1)
+    return mean + z * math.sqrt(variance / count)
+
+
+def get_abort_speed(resolution: str = None) -> float:
+    """
+    Get the speed under which a probe can be aborted, 0 when the results are not filtered by speed
+    """
+    if not open_speed_test_early_abort or not open_filter_speed or open_supply:
+        return 0
+    if resolution:
+        return resolution_speed_map.get(resolution, min_speed_value)
+    return min([min_speed_value, *resolution_speed_map.values()])
 
 
 async def get_speed_with_download(url: str, headers: dict = None, session: ClientSession = None,
-                                  timeout: int = speed_test_timeout) -> dict[str, float | None]:
+                                  timeout: int = speed_test_timeout, head_size: int = 0, min_speed: float = 0,
+                                  max_size: int = speed_test_max_size) -> dict[str, float | None]:
     """
-    Get the speed of the url with a total timeout
+    Get the speed of the url with a total timeout, the first head_size bytes are kept in the result as head,
+    the download is aborted once the throughput is clearly under min_speed or max_size bytes are read
     """
     start_time = time()
+    manager = get_run_manager()
     delay = -1
     total_size = 0
     min_bytes = 64 * 1024
+    head = bytearray()
+    stable = False
+    aborted = False
     last_sample_time = start_time
     last_sample_size = 0
 
-    if session is None:
-        session = ClientSession(connector=TCPConnector(ssl=False), trust_env=True)
-        created_session = True
-    else:
-        created_session = False
-
     speed_samples: list[float] = []
+    bucket_speeds: list[float] = []
     try:
-        async with session.get(url, headers=headers, timeout=timeout) as response:
+        async with session_scope(session) as session, session.get(url, headers=headers,
+                                                                  timeout=timeout) as response:
             if response.status != 200:
                 raise Exception("Invalid response")
             delay = int(round((time() - start_time) * 1000))
-            async for chunk in response.content.iter_any():
+            bucket_start = time()
+            bucket_size = 0
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(response.content.readany(), abort_sample_interval)
+                except asyncio.TimeoutError:
+                    chunk = None
+                now = time()
+                elapsed = now - start_time
+                if chunk == b'' or elapsed >= timeout:
+                    break
                 if chunk:
                     total_size += len(chunk)
-                    now = time()
-                    elapsed = now - start_time
+                    bucket_size += len(chunk)
+                    if manager:
+                        manager.received += len(chunk)
+                    if len(head) < head_size:
+                        head.extend(chunk[:head_size - len(head)])
                     delta_t = now - last_sample_time
                     delta_b = total_size - last_sample_size
                     if delta_t > 0 and delta_b > 0:
@@ -78,30 +256,35 @@ async def get_speed_with_download(url: str, headers: dict = None, session: Clien
                         speed_samples.append(inst_speed)
                         last_sample_time = now
                         last_sample_size = total_size
+                    if max_size and total_size >= max_size:
+                        break
                     if (elapsed >= min_measure_time and total_size >= min_bytes
                             and len(speed_samples) >= stability_window):
                         window = speed_samples[-stability_window:]
                         mean = sum(window) / len(window)
                         if mean > 0 and (max(window) - min(window)) / mean < stability_threshold:
-                            total_time = elapsed
-                            return {
-                                'speed': total_size / total_time / 1024 / 1024,
-                                'delay': delay,
-                                'size': total_size,
-                                'time': total_time,
-                            }
+                            stable = True
+                            break
+                if now - bucket_start >= abort_sample_interval:
+                    bucket_speeds.append(bucket_size / (now - bucket_start) / 1024 / 1024)
+                    bucket_start, bucket_size = now, 0
+                    if (min_speed and len(bucket_speeds) >= abort_min_samples
+                            and get_speed_upper_bound(bucket_speeds) < min_speed):
+                        aborted = True
+                        break
     except:
         pass
     finally:
         total_time = time() - start_time
-        if created_session:
-            await session.close()
         speed_value = total_size / total_time / 1024 / 1024 if total_time > 0 else 0.0
         return {
             'speed': speed_value,
             'delay': delay,
             'size': total_size,
             'time': total_time,
+            'head': bytes(head),
+            'stable': stable,
+            'aborted': aborted,
         }
 
 
@@ -111,20 +294,14 @@ async def get_headers(url: str, headers: dict = None, session: ClientSession = N
     """
     Get the headers of the url
     """
-    if session is None:
-        session = ClientSession(connector=TCPConnector(ssl=False), trust_env=True)
-        created_session = True
-    else:
-        created_session = False
     res_headers = {}
     try:
-        async with session.head(url, headers=headers, timeout=timeout) as response:
+        async with session_scope(session) as session, session.head(url, headers=headers,
+                                                                   timeout=timeout) as response:
             res_headers = response.headers
     except:
         pass
     finally:
-        if created_session:
-            await session.close()
         return res_headers
 
 
@@ -133,14 +310,10 @@ async def get_url_content(url: str, headers: dict = None, session: ClientSession
     """
     Get the content of the url
     """
-    if session is None:
-        session = ClientSession(connector=TCPConnector(ssl=False), trust_env=True)
-        created_session = True
-    else:
-        created_session = False
     content = ""
     try:
-        async with session.get(url, headers=headers, timeout=timeout) as response:
+        async with session_scope(session) as session, session.get(url, headers=headers,
+                                                                  timeout=timeout) as response:
             if response.status == 200:
                 content = await response.text()
             else:
@@ -148,11 +321,31 @@ async def get_url_content(url: str, headers: dict = None, session: ClientSession
     except:
         pass
     finally:
-        if created_session:
-            await session.close()
         return content
 
 
+async def get_first_byte_delay(url: str, headers: dict = None, session: ClientSession = None,
+                               timeout: float = config.speed_test_triage_timeout) -> int:
+    """
+    Get the connect and first byte delay of the url, -1 if the url is unreachable,
+    the timeout only applies to the connect and the first read, not to the wait for a pooled connection
+    """
+    start_time = time()
+    client_timeout = ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    try:
+        url = quote(url, safe=':/?$&=@[]%').partition('$')[0]
+        async with session_scope(session) as session, session.get(url, headers=headers,
+                                                                  timeout=client_timeout) as response:
+            if response.status >= 400:
+                return -1
+            chunk = await response.content.readany()
+            if not chunk:
+                return -1
+            return int(round((time() - start_time) * 1000))
+    except:
+        return -1
+
+
 def check_m3u8_valid(headers: CIMultiDictProxy[str] | dict[any, any]) -> bool:
     """
     Check if the m3u8 url is valid
@@ -248,6 +441,73 @@ def _try_extract_speed_from_ffmpeg_output(output: str) -> float | None:
     return None
 
 
+async def probe_hls_playlist(playlist_url: str, media_playlist: m3u8.M3U8 = None, headers: dict = None,
+                             session: ClientSession = None, timeout: int = speed_test_timeout,
+                             filter_resolution: bool = config.open_filter_resolution) -> dict[str, float | None]:
+    """
+    Get the speed of the hls media playlist by downloading its segments one by one,
+    stop once a segment download reaches the stability window or the timeout is used up
+    """
+    info = {'speed': 0, 'delay': -1, 'resolution': None}
+    if media_playlist is None:
+        playlist_content = await get_url_content(playlist_url, headers, session, timeout)
+        if not playlist_content:
+            return info
+        media_playlist = m3u8.loads(playlist_content)
+    segment_urls = [urljoin(playlist_url, segment.uri) for segment in media_playlist.segments][:5]
+    if not segment_urls:
+        return info
+    manager = get_run_manager()
+    start_time = time()
+    total_size = 0
+    total_time = 0.0
+    downloaded = 0
+    for i, ts_url in enumerate(segment_urls):
+        remaining = timeout - (time() - start_time)
+        if remaining <= 0:
+            break
+        result = await get_speed_with_download(ts_url, headers, session, remaining,
+                                               head_size=resolution_head_size if filter_resolution and i == 0 else 0,
+                                               min_speed=get_abort_speed(info['resolution']),
+                                               max_size=max(1, speed_test_max_size - total_size)
+                                               if speed_test_max_size else 0)
+        downloaded += 1
+        total_size += result['size']
+        total_time += result['time']
+        if i == 0 and filter_resolution:
+            info['resolution'] = get_resolution_from_bytes(result['head'])
+        if result['stable'] or result['aborted'] or result['delay'] == -1:
+            break
+        if speed_test_max_size and total_size >= speed_test_max_size:
+            break
+    if manager:
+        manager.hls_segments += downloaded
+        manager.hls_segments_skipped += len(segment_urls) - downloaded
+    info['speed'] = total_size / total_time / 1024 / 1024 if total_time > 0 else 0
+    info['delay'] = int(round((time() - start_time) * 1000))
+    return info
+
+
+async def get_hls_result(playlist_url: str, media_playlist: m3u8.M3U8 = None, headers: dict = None,
+                         session: ClientSession = None, timeout: int = speed_test_timeout,
+                         filter_resolution: bool = config.open_filter_resolution) -> dict[str, float | None]:
+    """
+    Get the speed of the hls media playlist, urls sharing the same media playlist in a run share one probe
+    """
+    manager = get_run_manager()
+    if manager is None:
+        return await probe_hls_playlist(playlist_url, media_playlist, headers, session, timeout, filter_resolution)
+    key = (playlist_url, tuple(sorted((headers or {}).items())))
+    probe = manager.hls_probes.get(key)
+    if probe is None:
+        probe = asyncio.ensure_future(
+            probe_hls_playlist(playlist_url, media_playlist, headers, session, timeout, filter_resolution))
+        manager.hls_probes[key] = probe
+    else:
+        manager.hls_shared += 1
+    return dict(await asyncio.shield(probe))
+
+
 async def get_result(url: str, headers: dict = None, resolution: str = None,
                      filter_resolution: bool = config.open_filter_resolution,
                      timeout: int = speed_test_timeout) -> dict[str, float | None]:
@@ -256,9 +516,10 @@ async def get_result(url: str, headers: dict = None, resolution: str = None,
     """
     info = {'speed': 0, 'delay': -1, 'resolution': resolution}
     location = None
+    head_size = resolution_head_size if filter_resolution and not resolution else 0
     try:
         url = quote(url, safe=':/?$&=@[]%').partition('$')[0]
-        async with ClientSession(connector=TCPConnector(ssl=False), trust_env=True) as session:
+        async with session_scope() as session:
             res_headers = await get_headers(url, headers, session)
             location = res_headers.get('Location')
             if location:
@@ -267,49 +528,42 @@ async def get_result(url: str, headers: dict = None, resolution: str = None,
                 url_content = await get_url_content(url, headers, session, timeout)
                 if url_content:
                     m3u8_obj = m3u8.loads(url_content)
-                    playlists = m3u8_obj.playlists
-                    segments = m3u8_obj.segments
-                    if playlists:
+                    playlist_url, media_playlist = url, m3u8_obj
+                    if m3u8_obj.playlists:
                         best_playlist = max(m3u8_obj.playlists, key=lambda p: p.stream_info.bandwidth)
-                        playlist_url = urljoin(url, best_playlist.uri)
-                        playlist_content = await get_url_content(playlist_url, headers, session, timeout)
-                        if playlist_content:
-                            media_playlist = m3u8.loads(playlist_content)
-                            segment_urls = [urljoin(playlist_url, segment.uri) for segment in media_playlist.segments]
-                    else:
-                        segment_urls = [urljoin(url, segment.uri) for segment in segments]
-                    if not segment_urls:
-                        raise Exception("Segment urls not found")
+                        playlist_url, media_playlist = urljoin(url, best_playlist.uri), None
+                    hls_info = await get_hls_result(playlist_url, media_playlist, headers, session, timeout,
+                                                    filter_resolution)
+                    info['speed'], info['delay'] = hls_info['speed'], hls_info['delay']
+                    if not info['resolution']:
+                        info['resolution'] = hls_info['resolution']
+                    try:
+                        if round(info['speed'], 2) == 0 and info['delay'] != -1:
+                            ff_out = await ffmpeg_url(url, headers, timeout)
+                            if ff_out:
+                                parsed_speed = _try_extract_speed_from_ffmpeg_output(ff_out)
+                                if parsed_speed is not None and parsed_speed > 0:
+                                    info['speed'] = parsed_speed
+                                try:
+                                    _, parsed_resolution = get_video_info(ff_out)
+                                    if parsed_resolution:
+                                        info['resolution'] = parsed_resolution
+                                        probe_store.add_resolution(url, get_url_host(url), parsed_resolution)
+                                except Exception:
+                                    pass
+                    except Exception:
+                        pass
                 else:
-                    res_info = await get_speed_with_download(url, headers, session, timeout)
+                    res_info = await get_speed_with_download(url, headers, session, timeout, head_size=head_size,
+                                                             min_speed=get_abort_speed(resolution))
                     info.update({'speed': res_info['speed'], 'delay': res_info['delay']})
-                start_time = time()
-                tasks = [get_speed_with_download(ts_url, headers, session, timeout) for ts_url in segment_urls[:5]]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                total_size = sum(result['size'] for result in results if isinstance(result, dict))
-                total_time = sum(result['time'] for result in results if isinstance(result, dict))
-                info['speed'] = total_size / total_time / 1024 / 1024 if total_time > 0 else 0
-                info['delay'] = int(round((time() - start_time) * 1000))
-                try:
-                    if round(info['speed'], 2) == 0 and info['delay'] != -1:
-                        ff_out = await ffmpeg_url(url, headers, timeout)
-                        if ff_out:
-                            parsed_speed = _try_extract_speed_from_ffmpeg_output(ff_out)
-                            if parsed_speed is not None and parsed_speed > 0:
-                                info['speed'] = parsed_speed
-                            try:
-                                _, parsed_resolution = get_video_info(ff_out)
-                                if parsed_resolution:
-                                    info['resolution'] = parsed_resolution
-                            except Exception:
-                                pass
-                except Exception:
-                    pass
+                    if not info['resolution'] and filter_resolution:
+                        info['resolution'] = get_resolution_from_bytes(res_info['head'])
     except:
         pass
     finally:
         if not info['resolution'] and filter_resolution and not location and info['delay'] != -1:
-            info['resolution'] = await get_resolution_ffprobe(url, headers, timeout)
+            info['resolution'] = await get_resolution_cached(url, headers, timeout)
         return info
 
 
@@ -369,91 +623,71 @@ async def ffmpeg_url(url, headers=None, timeout=speed_test_timeout):
         args += ["-headers", headers_str]
     args += ["-http_persistent", "0", "-stats", "-i", url, "-f", "null", "-"]
 
-    proc = None
     stderr_parts: list[bytes] = []
     speed_samples: list[float] = []
     bitrate_re = re.compile(r"bitrate=\s*([0-9\.]+)\s*k?bits/s", re.IGNORECASE)
-    start = time()
 
     try:
-        proc = await asyncio.create_subprocess_exec(
-            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-
-        while True:
-            try:
-                line = await asyncio.wait_for(proc.stderr.readline(), timeout=0.5)
-            except asyncio.TimeoutError:
-                line = b''
-            now = time()
-            elapsed = now - start
-
-            if line == b'':
-                if proc.returncode is None:
-                    if elapsed >= timeout:
-                        proc.kill()
-                        await proc.wait()
-                        break
-                    await asyncio.sleep(0)
-                    if proc.returncode is not None:
+        async with media_pool.spawn(*args, timeout=timeout) as proc:
+            start = time()
+            while True:
+                try:
+                    line = await asyncio.wait_for(proc.stderr.readline(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    line = b''
+                now = time()
+                elapsed = now - start
+
+                if line == b'':
+                    if proc.returncode is None:
+                        if elapsed >= timeout:
+                            proc.kill()
+                            await proc.wait()
+                            break
+                        await asyncio.sleep(0)
+                        if proc.returncode is not None:
+                            break
+                        continue
+                    else:
                         break
-                    continue
-                else:
-                    break
 
-            stderr_parts.append(line)
+                stderr_parts.append(line)
 
-            try:
-                text = line.decode(errors="ignore")
-            except Exception:
-                text = ""
-
-            m = bitrate_re.search(text)
-            if m:
                 try:
-                    kbps = float(m.group(1))
-                    mbps = kbps / 8.0 / 1024.0
-                    speed_samples.append(mbps)
+                    text = line.decode(errors="ignore")
                 except Exception:
-                    pass
+                    text = ""
 
-            if elapsed >= min_measure_time and len(speed_samples) >= stability_window:
-                window = speed_samples[-stability_window:]
-                mean = sum(window) / len(window)
-                if mean > 0 and (max(window) - min(window)) / mean < stability_threshold:
+                m = bitrate_re.search(text)
+                if m:
                     try:
-                        proc.kill()
+                        kbps = float(m.group(1))
+                        mbps = kbps / 8.0 / 1024.0
+                        speed_samples.append(mbps)
                     except Exception:
                         pass
-                    await proc.wait()
-                    break
 
-        try:
-            out, err = await asyncio.wait_for(proc.communicate(), timeout=1)
-            if err:
-                stderr_parts.append(err)
-            if out:
-                stderr_parts.append(out)
-        except Exception:
-            try:
-                proc.kill()
-            except Exception:
-                pass
-            await proc.wait()
-    except asyncio.TimeoutError:
-        if proc:
+                if elapsed >= min_measure_time and len(speed_samples) >= stability_window:
+                    window = speed_samples[-stability_window:]
+                    mean = sum(window) / len(window)
+                    if mean > 0 and (max(window) - min(window)) / mean < stability_threshold:
+                        try:
+                            proc.kill()
+                        except Exception:
+                            pass
+                        await proc.wait()
+                        break
+
             try:
-                proc.kill()
+                out, err = await asyncio.wait_for(proc.communicate(), timeout=1)
+                if err:
+                    stderr_parts.append(err)
+                if out:
+                    stderr_parts.append(out)
             except Exception:
                 pass
-            await proc.wait()
     except Exception:
-        if proc:
-            try:
-                proc.kill()
-            except Exception:
-                pass
-            await proc.wait()
+        pass
     finally:
         stderr_bytes = b"".join(stderr_parts)
         try:
@@ -467,7 +701,6 @@ async def get_resolution_ffprobe(url: str, headers: dict = None, timeout: int =
     Get the resolution of the url by ffprobe
     """
     resolution = None
-    proc = None
     try:
         probe_args = [
             'ffprobe',
@@ -478,20 +711,28 @@ async def get_resolution_ffprobe(url: str, headers: dict = None, timeout: int =
             "-of", 'json',
             url
         ]
-        proc = await asyncio.create_subprocess_exec(*probe_args, stdout=asyncio.subprocess.PIPE,
-                                                    stderr=asyncio.subprocess.PIPE)
-        out, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        async with media_pool.spawn(*probe_args, timeout=timeout) as proc:
+            out, _ = await asyncio.wait_for(proc.communicate(), timeout)
         video_stream = json.loads(out.decode('utf-8'))["streams"][0]
         resolution = f"{video_stream['width']}x{video_stream['height']}"
     except:
-        if proc:
-            proc.kill()
+        pass
     finally:
-        if proc:
-            await proc.wait()
         return resolution
 
 
+async def get_resolution_cached(url: str, headers: dict = None, timeout: int = speed_test_timeout) -> str | None:
+    """
+    Get the resolution of the url from the resolution cache, fall back to ffprobe and cache the result
+    """
+    hit, resolution = probe_store.get_cached_resolution(url)
+    if hit:
+        return resolution
+    resolution = await get_resolution_ffprobe(url, headers, timeout)
+    probe_store.add_resolution(url, get_url_host(url), resolution)
+    return resolution
+
+
 def get_video_info(video_info):
     """
     Get the video info
@@ -558,34 +799,86 @@ async def get_speed(data, headers=None, ipv6_proxy=None, filter_resolution=open_
     headers = {**request_headers, **(headers or {})}
     try:
         cache_key = data['host'] if speed_test_filter_host else url
+        stored_result = probe_store.get_fresh_result(cache_key, by_host=speed_test_filter_host) if cache_key else None
         if cache_key and cache_key in cache:
             result = get_avg_result(cache[cache_key])
+        elif stored_result and stored_result['confidence'] >= probe_store.SKIP_CONFIDENCE:
+            result.update(stored_result)
+            if resolution:
+                result['resolution'] = resolution
+            probe_store.record("skipped")
+            cache.setdefault(cache_key, []).append(result)
         else:
+            if stored_result:
+                timeout = max(1, int(timeout * min(1.0, stored_result['confidence'] / probe_store.SKIP_CONFIDENCE)))
+                probe_store.record("shortened")
+            else:
+                probe_store.record("probed")
             if data['ipv_type'] == "ipv6" and ipv6_proxy:
                 result.update(default_ipv6_result)
             elif constants.rt_url_pattern.match(url) is not None:
+                # ffprobe is the liveness check of the rtmp/rtsp urls, so the resolution cache is not used here
                 start_time = time()
                 if not result['resolution'] and filter_resolution:
                     result['resolution'] = await get_resolution_ffprobe(url, headers, timeout)
+                    probe_store.add_resolution(url, data.get('host'), result['resolution'])
                 result['delay'] = int(round((time() - start_time) * 1000))
                 if result['resolution'] is not None:
                     result['speed'] = float("inf")
+                probe_store.add_result(url, data.get('host'), result)
             else:
                 result.update(await get_result(url, headers, resolution, filter_resolution, timeout))
+                probe_store.add_result(url, data.get('host'), result)
             if cache_key:
                 cache.setdefault(cache_key, []).append(result)
     finally:
         if callback:
             callback()
         if logger:
-            origin = data.get('origin')
-            origin_name = t(f"name.{origin}") if origin else origin
-            logger.info(
-                f"{t("name.name")}: {data.get('name')}, {t("pbar.url")}: {data.get('url')}, {t("name.from")}: {origin_name}, {t("name.ipv_type")}: {data.get("ipv_type")}, {t("name.location")}: {data.get('location')}, {t("name.isp")}: {data.get('isp')}, {t("name.date")}: {data["date"]}, {t("name.delay")}: {result.get('delay') or -1} ms, {t("name.speed")}: {result.get('speed') or 0:.2f} M/s, {t("name.resolution")}: {result.get('resolution')}"
-            )
+            log_speed_result(logger, data, result)
         return result
 
 
+def log_speed_result(logger, data, result: TestResult) -> None:
+    """
+    Log the speed test result of the url
+    """
+    origin = data.get('origin')
+    origin_name = t(f"name.{origin}") if origin else origin
+    content = f"{t("name.name")}: {data.get('name')}, {t("pbar.url")}: {data.get('url')}, {t("name.from")}: {origin_name}, {t("name.ipv_type")}: {data.get("ipv_type")}, {t("name.location")}: {data.get('location')}, {t("name.isp")}: {data.get('isp')}, {t("name.date")}: {data.get("date")}, {t("name.delay")}: {result.get('delay') or -1} ms, {t("name.speed")}: {result.get('speed') or 0:.2f} M/s, {t("name.resolution")}: {result.get('resolution')}"
+    if "confidence" in result:
+        content += f", {t("name.confidence")}: {result["confidence"]:.2f}"
+    logger.info(content)
+
+
+def get_fanout_result(samples: list[TestResult], resolution: str = None) -> TestResult | None:
+    """
+    Get the result shared from the sampled urls of a cluster to its sibling urls, the resolution is never shared
+    since it can differ between the urls, return None when the samples disagree on whether the cluster is reachable
+    """
+    if not samples:
+        return None
+    alive = [item for item in samples if item.get('delay') not in (None, -1)]
+    if alive and len(alive) != len(samples):
+        return None
+    sample_weight = len(samples) / (len(samples) + 1)
+    if not alive:
+        return {'speed': 0, 'delay': -1, 'resolution': resolution, 'confidence': round(sample_weight, 2)}
+    speeds = [item.get('speed') or 0 for item in alive]
+    mean = sum(speeds) / len(speeds)
+    if any(math.isinf(speed) for speed in speeds) or mean <= 0:
+        agreement = 1.0
+    else:
+        agreement = max(0.0, 1 - (max(speeds) - min(speeds)) / mean)
+    result = get_avg_result(alive)
+    return {
+        'speed': result['speed'],
+        'delay': result['delay'],
+        'resolution': resolution,
+        'confidence': round(sample_weight * agreement, 2)
+    }
+
+
 def get_sort_result(
         results,
         supply=open_supply,
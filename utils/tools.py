@@ -16,14 +16,16 @@ from urllib.parse import urlparse, urlunparse
 import pytz
 import requests
 from bs4 import BeautifulSoup
-from flask import send_file, make_response
+from flask import make_response
 from opencc import OpenCC
 
 import utils.constants as constants
 from utils.config import config, resource_path
 from utils.i18n import t
+from utils.matcher import get_keyword_matcher
 from utils.types import ChannelData
 from utils.metadata import channel_metadata
+from utils.response_cache import response_cache
 
 opencc_t2s = OpenCC("t2s")
 
@@ -289,12 +291,12 @@ def check_ipv_type_match(ipv_type: str) -> bool:
 
 def check_url_by_keywords(url, keywords=None):
     """
-    Check by URL keywords
+    Check by URL keywords, the keywords are compiled once into a matcher and reused for the same list
     """
     if not keywords:
         return False
     else:
-        return any(keyword in url for keyword in keywords)
+        return get_keyword_matcher(keywords).search(url)
 
 
 def merge_objects(*objects, match_key=None):
@@ -401,93 +403,79 @@ def get_logo_url():
     return logo_url
 
 
-def convert_to_m3u(path=None, first_channel_name=None, data=None):
+def get_m3u_header() -> str:
     """
-    Convert result txt to m3u format
+    Get the header of the m3u content
     """
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as file:
-            m3u_output = f'#EXTM3U x-tvg-url="{get_epg_url()}"\n' if config.open_epg else "#EXTM3U\n"
-            current_group = None
-            logo_url = get_logo_url()
-            from_fanmingming = "https://raw.githubusercontent.com/fanmingming/live/main/tv" in logo_url
-            for line in file:
-                trimmed_line = line.strip()
-                if trimmed_line != "":
-                    if "#genre#" in trimmed_line:
-                        current_group = trimmed_line.replace(",#genre#", "").strip()
-                    else:
-                        try:
-                            original_channel_name, _, channel_link = map(
-                                str.strip, trimmed_line.partition(",")
-                            )
-                        except:
-                            continue
-                        use_name = first_channel_name if current_group in (t("content.update_time"),
-                                                                           t("content.update_running")) else original_channel_name
-                        processed_channel_name = use_name
-                        if from_fanmingming:
-                            processed_channel_name = re.sub(
-                                r"(CCTV|CETV)-(\d+)(\+.*)?",
-                                lambda m: f"{m.group(1)}{m.group(2)}"
-                                          + ("+" if m.group(3) else ""),
-                                use_name,
-                            )
-                        
-                        # Metadata lookup
-                        metadata = channel_metadata.get(original_channel_name)
-                        logo = metadata.get("logo") if metadata and metadata.get("logo") else join_url(logo_url, f'{processed_channel_name}.{config.logo_type}')
-                        epg_id = metadata.get("epg_id") if metadata and metadata.get("epg_id") else processed_channel_name
-                        group = metadata.get("group") if metadata and metadata.get("group") else current_group
-                        
-                        m3u_output += f'#EXTINF:-1 tvg-id="{epg_id}" tvg-name="{processed_channel_name}" tvg-logo="{logo}"'
-                        if group:
-                            m3u_output += f' group-title="{group}"'
-                        item_data = {}
-                        if data:
-                            item_list = data.get(original_channel_name, [])
-                            for item in item_list:
-                                if item["url"] == channel_link:
-                                    item_data = item
-                                    break
-                        if item_data:
-                            catchup = item_data.get("catchup")
-                            if catchup:
-                                for key, value in catchup.items():
-                                    m3u_output += f' {key}="{value}"'
-                        m3u_output += f",{original_channel_name}\n"
-                        if item_data and config.open_headers:
-                            headers = item_data.get("headers")
-                            if headers:
-                                for key, value in headers.items():
-                                    m3u_output += f"#EXTVLCOPT:http-{key.lower()}={value}\n"
-                        m3u_output += f"{channel_link}\n"
-            m3u_file_path = os.path.splitext(path)[0] + ".m3u"
-            with open(m3u_file_path, "w", encoding="utf-8") as m3u_file:
-                m3u_file.write(m3u_output)
+    return f'#EXTM3U x-tvg-url="{get_epg_url()}"\n' if config.open_epg else "#EXTM3U\n"
 
 
-def get_result_file_content(path=None, show_content=False, file_type=None):
+def get_m3u_entry(name: str, link: str, group: str = None, item: dict = None, tvg_name: str = None,
+                  logo_url: str = None) -> str:
     """
-    Get the content of the result file
+    Get the m3u entry of the channel url, item provides the catchup and headers of the url
+    """
+    logo_url = get_logo_url() if logo_url is None else logo_url
+    processed_channel_name = tvg_name or name
+    if "https://raw.githubusercontent.com/fanmingming/live/main/tv" in logo_url:
+        processed_channel_name = re.sub(
+            r"(CCTV|CETV)-(\d+)(\+.*)?",
+            lambda m: f"{m.group(1)}{m.group(2)}" + ("+" if m.group(3) else ""),
+            processed_channel_name,
+        )
+    metadata = channel_metadata.get(name)
+    logo = metadata.get("logo") if metadata and metadata.get("logo") else join_url(logo_url,
+                                                                                   f'{processed_channel_name}.{config.logo_type}')
+    epg_id = metadata.get("epg_id") if metadata and metadata.get("epg_id") else processed_channel_name
+    group = metadata.get("group") if metadata and metadata.get("group") else group
+    entry = f'#EXTINF:-1 tvg-id="{epg_id}" tvg-name="{processed_channel_name}" tvg-logo="{logo}"'
+    if group:
+        entry += f' group-title="{group}"'
+    if item:
+        catchup = item.get("catchup")
+        if catchup:
+            for key, value in catchup.items():
+                entry += f' {key}="{value}"'
+    entry += f",{name}\n"
+    if item and config.open_headers:
+        headers = item.get("headers")
+        if headers:
+            for key, value in headers.items():
+                entry += f"#EXTVLCOPT:http-{key.lower()}={value}\n"
+    return entry + f"{link}\n"
+
+
+def get_result_file_path(path=None, show_content=False, file_type=None):
+    """
+    Get the path of the result file to serve and whether it is served as an attachment
     """
     result_file = (
         os.path.splitext(path)[0] + f".{file_type}"
         if file_type
         else path
     )
-    if os.path.exists(result_file):
-        if config.open_m3u_result:
-            if file_type == "m3u" or not file_type:
-                result_file = os.path.splitext(path)[0] + ".m3u"
-            if file_type != "txt" and show_content == False:
-                return send_file(resource_path(result_file), as_attachment=True)
-        with open(result_file, "r", encoding="utf-8") as file:
-            content = file.read()
+    as_attachment = False
+    if config.open_m3u_result:
+        if file_type == "m3u" or not file_type:
+            result_file = os.path.splitext(path)[0] + ".m3u"
+        as_attachment = file_type != "txt" and show_content == False
+    if as_attachment:
+        result_file = resource_path(result_file)
+    return result_file, as_attachment
+
+
+def get_result_file_content(path=None, show_content=False, file_type=None):
+    """
+    Get the content of the result file
+    """
+    result_file, as_attachment = get_result_file_path(path, show_content, file_type)
+    if as_attachment:
+        response = response_cache.make_response(result_file, as_attachment=True)
     else:
-        content = constants.waiting_tip
-    response = make_response(content)
-    response.mimetype = 'text/plain'
+        response = response_cache.make_response(result_file, mimetype="text/plain")
+    if response is None:
+        response = make_response(constants.waiting_tip)
+        response.mimetype = 'text/plain'
     return response
 
 
@@ -529,6 +517,23 @@ def get_url_host(url):
     return None
 
 
+def get_url_template(url: str) -> str | None:
+    """
+    Get the url template made of the host with port and the path template,
+    number runs in the path are replaced with placeholders and query values are dropped
+    """
+    try:
+        parsed = urlparse(url)
+    except Exception:
+        return None
+    if not parsed.netloc:
+        return None
+    path = constants.url_number_pattern.sub("{n}", parsed.path)
+    query_keys = sorted({part.partition("=")[0] for part in parsed.query.split("&") if part})
+    template = f"{parsed.netloc}{path}"
+    return f"{template}?{'&'.join(query_keys)}" if query_keys else template
+
+
 def add_url_info(url, info):
     """
     Add url info to the URL
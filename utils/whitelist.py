@@ -4,6 +4,7 @@ from collections import defaultdict
 from typing import List, Pattern
 
 import utils.constants as constants
+from utils.matcher import KeywordMatcher
 from utils.tools import get_real_path, resource_path
 from utils.types import WhitelistMaps
 
@@ -69,28 +70,55 @@ def is_url_whitelisted(data_map: WhitelistMaps, url: str, channel_name: str | No
     if not url or not data_map:
         return False
 
-    exact_map, keyword_map = data_map
-    channel_key = channel_name or ""
+    return get_whitelist_matcher(data_map).is_whitelisted(url, channel_name)
 
-    def check_exact_for(key):
-        for candidate in exact_map.get(key, []):
-            if not candidate:
-                continue
-            c = candidate.strip()
-            if c == url:
-                return True
-        return False
 
-    if check_exact_for(channel_key) or check_exact_for(""):
-        return True
+class WhitelistMatcher:
+    """
+    Compiled whitelist maps, the exact entries of each channel are kept in hash sets and the keywords of
+    each channel are merged with the global ones into one matcher compiled on first use
+    """
 
-    for kw in keyword_map.get(channel_key, []) + keyword_map.get("", []):
-        if not kw:
-            continue
-        if kw in url:
+    def __init__(self, data_map: WhitelistMaps):
+        exact_map, keyword_map = data_map
+        self.exact_map = exact_map
+        self.keyword_map = keyword_map
+        self.exact = {
+            key: frozenset(c for candidate in entries if candidate and (c := candidate.strip()))
+            for key, entries in exact_map.items()
+        }
+        self._keywords: dict[str, KeywordMatcher] = {}
+
+    def get_keyword_matcher(self, channel_key: str) -> KeywordMatcher:
+        if channel_key not in self.keyword_map:
+            channel_key = ""
+        matcher = self._keywords.get(channel_key)
+        if matcher is None:
+            entries = self.keyword_map.get(channel_key, []) + (self.keyword_map.get("", []) if channel_key else [])
+            matcher = KeywordMatcher(kw for kw in entries if kw)
+            self._keywords[channel_key] = matcher
+        return matcher
+
+    def is_whitelisted(self, url: str, channel_name: str | None = None) -> bool:
+        channel_key = channel_name or ""
+        if url in self.exact.get(channel_key, ()) or url in self.exact.get("", ()):
             return True
+        return self.get_keyword_matcher(channel_key).search(url)
 
-    return False
+
+_whitelist_matcher: WhitelistMatcher | None = None
+
+
+def get_whitelist_matcher(data_map: WhitelistMaps) -> WhitelistMatcher:
+    """
+    Get the compiled matcher of the whitelist maps, it is compiled once and reused while the same maps are passed
+    """
+    global _whitelist_matcher
+    matcher = _whitelist_matcher
+    if matcher is None or matcher.exact_map is not data_map[0] or matcher.keyword_map is not data_map[1]:
+        matcher = WhitelistMatcher(data_map)
+        _whitelist_matcher = matcher
+    return matcher
 
 
 def get_whitelist_url(data_map: WhitelistMaps, channel_name: str | None = None) -> List[str]: